@@ -10,7 +10,7 @@ import datetime
 import json
 from typing import List, Dict, Tuple, Set, Optional
 from dataclasses import dataclass
-from collections import defaultdict
+from collections import Counter, defaultdict
 import multiprocessing as mp
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 
@@ -1030,14 +1030,12 @@ class TimetableGenerator:
         print(f"📈 Average activities per section: {total_activities_created / len(self.sections):.1f}")
         
         # Show activities per section
-        section_counts = {}
-        for activity in activities:
-            section_id = activity.section_id
-            section_counts[section_id] = section_counts.get(section_id, 0) + 1
+        section_counts = Counter(activity.section_id for activity in activities)
+        section_names = {s.id: s.name for s in self.sections}
         
         print(f"\n📊 Activities per section:")
         for section_id, count in sorted(section_counts.items()):
-            section_name = next((s.name for s in self.sections if s.id == section_id), f"Section {section_id}")
+            section_name = section_names.get(section_id, f"Section {section_id}")
             print(f"  {section_name}: {count} activities")
         
         return activities
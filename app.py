@@ -1,19 +1,24 @@
 import os
 import json
+import hashlib
 from datetime import datetime, timezone
 from flask import Flask, request, redirect, url_for, g
 
 from config import Config
-from extensions import db
+from extensions import db, cache, ORJSONProvider
 from models import AppConfig, User, Subject, Course, TimetableEntry, SystemMetric
+from utils import start_activity_logger, upgrade_schema
 
 def create_app(config_class=Config):
     # --- App Initialization ---
     app = Flask(__name__)
     app.config.from_object(config_class)
+    app.json = ORJSONProvider(app)
 
     # --- Initialize Extensions ---
     db.init_app(app)
+    cache.init_app(app)
+    start_activity_logger(app)
 
     # --- Import and Register Blueprints ---
     from routes.main import main_bp
@@ -57,6 +62,16 @@ def create_app(config_class=Config):
             print(f"Redirecting to setup due to error: {e}")
             return redirect(url_for('main.setup'))
 
+    @app.after_request
+    def add_etag(response):
+        # Tag JSON reads so polling clients can revalidate with If-None-Match
+        # and get an empty 304 when nothing changed.
+        if (request.method == 'GET' and response.status_code == 200
+                and response.mimetype == 'application/json' and not response.is_streamed):
+            response.set_etag(hashlib.blake2b(response.get_data(), digest_size=16).hexdigest())
+            return response.make_conditional(request)
+        return response
+
     @app.context_processor
     def inject_global_vars():
         # This makes 'institute_name' available in all templates
@@ -73,10 +88,12 @@ if __name__ == '__main__':
     with app.app_context():
         # Create database tables if they don't exist
         db.create_all()
+        upgrade_schema()
         
-        # Log system metrics once per day
+        # Log system metrics once per day; setup seeds the first day itself
         today = datetime.now(timezone.utc).date()
-        if not SystemMetric.query.filter_by(date=today).first():
+        setup_complete = AppConfig.query.filter_by(key='setup_complete', value='true').first()
+        if setup_complete and not SystemMetric.query.filter_by(date=today).first():
              db.session.add(SystemMetric(key='total_students', value=User.query.filter_by(role='student').count()))
              db.session.add(SystemMetric(key='total_teachers', value=User.query.filter_by(role='teacher').count()))
              total_subjects = Subject.query.count() + Course.query.count()
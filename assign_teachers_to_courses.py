@@ -44,7 +44,7 @@ def assign_teachers_to_courses():
             
             # Get available teachers (not assigned to too many courses)
             available_teachers = [t for t in teachers if len(assignments) < 5 or 
-                                len([a for a in assignments if a[0] == t.id]) < 5]
+                                sum(1 for a in assignments if a[0] == t.id) < 5]
             
             if not available_teachers:
                 print("⚠️ No available teachers")
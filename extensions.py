@@ -1,6 +1,32 @@
 # This file is used to instantiate extensions like SQLAlchemy
 # to avoid circular import issues.
 
+import orjson
+from flask.json.provider import DefaultJSONProvider
+from flask_caching import Cache
 from flask_sqlalchemy import SQLAlchemy
 
 db = SQLAlchemy()
+cache = Cache()
+
+
+class ORJSONProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson.
+
+    Datetimes are passed through to Flask's default handler so they keep
+    the same HTTP-date format as before. Keys are left in insertion order;
+    nothing on the client depends on sorted keys.
+    """
+    options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        option = self.options
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
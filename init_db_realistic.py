@@ -366,7 +366,7 @@ def create_realistic_data():
     teacher_course_assignments = []
     for course in courses:
         # Find teachers who can teach this course (random assignment for now)
-        available_teachers = [t for t in teachers if len([tc for tc in teacher_course_assignments if tc[0] == t.id]) < 5]
+        available_teachers = [t for t in teachers if sum(1 for tc in teacher_course_assignments if tc[0] == t.id) < 5]
         if available_teachers:
             teacher = random.choice(available_teachers)
             teacher_course_assignments.append((teacher.id, course.id))
@@ -77,6 +77,8 @@ class Student(db.Model):
     full_name = db.Column(db.String(120), nullable=False)
     section_id = db.Column(db.Integer, db.ForeignKey('student_section.id'))
     user = relationship("User", back_populates="student")
+    # Section listings and imports look students up by section
+    __table_args__ = (db.Index('ix_student_section_id', 'section_id'),)
     electives = relationship("Subject", secondary=student_electives_association, backref="students")
 
 class Teacher(db.Model):
@@ -128,6 +130,7 @@ class AttendanceRecord(db.Model):
     entry_id = db.Column(db.Integer, db.ForeignKey('timetable_entry.id'), nullable=False)
     date = db.Column(db.Date, nullable=False)
     status = db.Column(db.String(10), nullable=False)
+    __table_args__ = (db.Index('ix_attendance_record_student_date', 'student_id', 'date'),)
 
 class Exam(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -149,6 +152,8 @@ class ExamSeating(db.Model):
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     classroom_id = db.Column(db.Integer, db.ForeignKey('classroom.id'), nullable=False)
     seat_number = db.Column(db.String(10))
+    # Seating plans are read and replaced per exam
+    __table_args__ = (db.Index('ix_exam_seating_exam_id', 'exam_id'),)
     
     # Relationships
     student = relationship("Student", backref="exam_seatings")
@@ -171,4 +176,6 @@ class ActivityLog(db.Model):
 
 class SystemMetric(db.Model):
     id = db.Column(db.Integer, primary_key=True); date = db.Column(db.Date, default=lambda: datetime.now(timezone.utc).date()); key = db.Column(db.String(50)); value = db.Column(db.Integer)
+    # One snapshot per key and day; growth baselines are looked up by key and date
+    __table_args__ = (db.Index('ix_system_metric_key_date', 'key', 'date', unique=True),)
 
@@ -2,7 +2,7 @@ from flask import Blueprint, jsonify, request, session, redirect, url_for, rende
 
 from extensions import db
 from models import Classroom
-from utils import log_activity
+from utils import log_activity, rollback_on_error, invalidate_timetable_export
 
 classrooms_bp = Blueprint('classrooms', __name__, url_prefix='/classrooms')
 
@@ -14,62 +14,56 @@ def manage_classrooms():
 
 @classrooms_bp.route('/api', methods=['GET', 'POST'])
 @classrooms_bp.route('/api/<int:classroom_id>', methods=['PUT', 'DELETE'])
+@rollback_on_error(error_message="An unexpected server error occurred.", conflicts={"room_id": "Classroom with ID '{room_id}' already exists."})
 def handle_classrooms(classroom_id=None):
     if 'user_id' not in session:
         return jsonify({"message": "Unauthorized"}), 401
     
-    try:
-        if request.method == 'GET':
-            classrooms = Classroom.query.order_by(Classroom.room_id).all()
-            classroom_list = []
-            for c in classrooms:
-                # Handle features - if it's a string, split by comma; if it's already a list, use as is
-                if isinstance(c.features, str):
-                    features = [f.strip() for f in c.features.split(',') if f.strip()]
-                else:
-                    features = c.features or []
-                
-                classroom_list.append({
-                    "id": c.id, 
-                    "room_id": c.room_id, 
-                    "capacity": c.capacity, 
-                    "features": features
-                })
-            return jsonify({"classrooms": classroom_list})
+    if request.method == 'GET':
+        rows = db.session.query(Classroom.id, Classroom.room_id, Classroom.capacity, Classroom.features).order_by(Classroom.room_id)
+        classroom_list = []
+        for item_id, room_id, capacity, features in rows:
+            # Handle features - if it's a string, split by comma; if it's already a list, use as is
+            if isinstance(features, str):
+                features = [f.strip() for f in features.split(',') if f.strip()]
+            else:
+                features = features or []
+            
+            classroom_list.append({
+                "id": item_id, 
+                "room_id": room_id, 
+                "capacity": capacity, 
+                "features": features
+            })
+        return jsonify({"classrooms": classroom_list})
 
-        data = request.json
-        if not data.get('room_id') or not data.get('capacity'):
-            return jsonify({"message": "Room ID and Capacity are required fields."}), 400
+    data = request.json
+    if not data.get('room_id') or not data.get('capacity'):
+        return jsonify({"message": "Room ID and Capacity are required fields."}), 400
 
-        if request.method == 'POST':
-            if Classroom.query.filter_by(room_id=data['room_id']).first():
-                return jsonify({"message": f"Classroom with ID '{data['room_id']}' already exists."}), 409
-            
-            new_classroom = Classroom(room_id=data['room_id'], capacity=data['capacity'], features=data.get('features', []))
-            db.session.add(new_classroom)
-            log_activity('info', f"Classroom '{data['room_id']}' created.")
-            message = "Classroom created successfully."
+    if request.method == 'POST':
+        new_classroom = Classroom(room_id=data['room_id'], capacity=data['capacity'], features=data.get('features', []))
+        db.session.add(new_classroom)
+        db.session.flush()
+        activity = ('info', f"Classroom '{data['room_id']}' created.")
+        message = "Classroom created successfully."
 
-        else: # PUT or DELETE
-            classroom = Classroom.query.get_or_404(classroom_id)
-            if request.method == 'PUT':
-                if classroom.room_id != data['room_id'] and Classroom.query.filter_by(room_id=data['room_id']).first():
-                    return jsonify({"message": f"Classroom with ID '{data['room_id']}' already exists."}), 409
-                
-                classroom.room_id = data['room_id']
-                classroom.capacity = data['capacity']
-                classroom.features = data.get('features', [])
-                log_activity('info', f"Classroom '{classroom.room_id}' updated.")
-                message = "Classroom updated successfully."
-            
-            elif request.method == 'DELETE':
-                db.session.delete(classroom)
-                log_activity('warning', f"Classroom '{classroom.room_id}' deleted.")
-                message = "Classroom deleted successfully."
+    else: # PUT or DELETE
+        classroom = db.get_or_404(Classroom, classroom_id)
+        if request.method == 'PUT':
+            classroom.room_id = data['room_id']
+            classroom.capacity = data['capacity']
+            classroom.features = data.get('features', [])
+            db.session.flush()
+            activity = ('info', f"Classroom '{classroom.room_id}' updated.")
+            message = "Classroom updated successfully."
         
-        db.session.commit()
-        return jsonify({"message": message})
-        
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"message": "An unexpected server error occurred."}), 500
+        elif request.method == 'DELETE':
+            db.session.delete(classroom)
+            activity = ('warning', f"Classroom '{classroom.room_id}' deleted.")
+            message = "Classroom deleted successfully."
+    
+    db.session.commit()
+    invalidate_timetable_export()
+    log_activity(*activity)
+    return jsonify({"message": message})
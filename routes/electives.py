@@ -1,6 +1,8 @@
+from collections import defaultdict
+
 from flask import Blueprint, render_template, request, jsonify, session
-from models import db, Subject, Student, StudentSection
-from sqlalchemy.orm import joinedload
+from models import db, Subject, Student, StudentSection, student_electives_association
+from routes.subjects import load_elective_items
 
 electives_bp = Blueprint('electives', __name__, url_prefix='/electives')
 
@@ -19,30 +21,25 @@ def handle_elective_status():
         return jsonify({"error": "Unauthorized"}), 401
     
     try:
-        # Get all elective subjects
-        electives = Subject.query.filter_by(is_elective=True).all()
-        
-        # Get students with their elective choices
-        students = Student.query.options(
-            joinedload(Student.electives),
-            joinedload(Student.section)
-        ).all()
-        
-        data = {
-            'electives': [{'id': e.id, 'name': e.name, 'code': e.code} for e in electives],
-            'students': []
-        }
-        
-        for student in students:
-            student_data = {
-                'id': student.id,
-                'name': student.full_name,
-                'section': student.section.name if student.section else 'No Section',
-                'electives': [{'id': e.id, 'name': e.name} for e in student.electives]
-            }
-            data['students'].append(student_data)
-        
-        return jsonify(data)
+        # Group elective choices by student from the association table
+        chosen = defaultdict(list)
+        choices = db.session.query(student_electives_association.c.student_id, Subject.id, Subject.name) \
+            .join(Subject, Subject.id == student_electives_association.c.subject_id)
+        for student_id, subject_id, name in choices:
+            chosen[student_id].append({'id': subject_id, 'name': name})
+        
+        students = db.session.query(Student.id, Student.full_name, StudentSection.name) \
+            .outerjoin(StudentSection, StudentSection.id == Student.section_id)
+        
+        return jsonify({
+            'electives': load_elective_items(),
+            'students': [{
+                'id': student_id,
+                'name': full_name,
+                'section': section_name or 'No Section',
+                'electives': chosen[student_id]
+            } for student_id, full_name, section_name in students]
+        })
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -54,17 +51,13 @@ def get_electives_data():
         return jsonify({"error": "Unauthorized"}), 401
     
     try:
-        # Get all elective subjects
-        electives = Subject.query.filter_by(is_elective=True).all()
-        
-        # Get students with their sections
-        students = Student.query.options(
-            joinedload(Student.section)
-        ).all()
+        # Get students with their section names
+        students = db.session.query(Student.id, Student.full_name, StudentSection.name) \
+            .outerjoin(StudentSection, StudentSection.id == Student.section_id)
         
         data = {
-            'electives': [{'id': e.id, 'name': e.name, 'code': e.code} for e in electives],
-            'students': [{'id': s.id, 'name': s.full_name, 'section': s.section.name if s.section else 'No Section'} for s in students]
+            'electives': load_elective_items(),
+            'students': [{'id': student_id, 'name': full_name, 'section': section_name or 'No Section'} for student_id, full_name, section_name in students]
         }
         
         return jsonify(data)
@@ -86,16 +79,15 @@ def assign_electives():
         if not student_id:
             return jsonify({"error": "Student ID required"}), 400
         
-        student = Student.query.get(student_id)
-        if not student:
+        if not db.session.query(Student.id).filter_by(id=student_id).first():
             return jsonify({"error": "Student not found"}), 404
         
-        # Get elective subjects
-        electives = Subject.query.filter(Subject.id.in_(elective_ids), Subject.is_elective == True).all()
-        
-        # Clear existing electives and assign new ones
-        student.electives.clear()
-        student.electives.extend(electives)
+        # Replace the student's electives with one delete and one bulk insert
+        table = student_electives_association
+        db.session.execute(table.delete().where(table.c.student_id == student_id))
+        valid_ids = [subject_id for (subject_id,) in db.session.query(Subject.id).filter(Subject.id.in_(set(elective_ids)), Subject.is_elective == True)] if elective_ids else []
+        if valid_ids:
+            db.session.execute(table.insert(), [{"student_id": student_id, "subject_id": subject_id} for subject_id in valid_ids])
         
         db.session.commit()
         
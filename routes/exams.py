@@ -1,17 +1,39 @@
-import json
+import hashlib
 import os
+import time
+import uuid
+import orjson
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from flask import Blueprint, jsonify, request, session, redirect, url_for, render_template, g, send_file
-from sqlalchemy.orm import joinedload
-from sqlalchemy import exc
+from itertools import groupby
+from operator import itemgetter
+from flask import Blueprint, jsonify, request, session, redirect, url_for, render_template, g, send_file, current_app
+from sqlalchemy import exc, func
 
-from extensions import db
+from extensions import db, cache
 from models import Exam, ExamSeating, Student, Classroom, Subject, Course, Teacher, StudentSection
 from utils import log_activity, validate_json_request
 
 exams_bp = Blueprint('exams', __name__, url_prefix='/exams')
 
+# Identical prompts get the same Gemini answer back from the cache for a day.
+GEMINI_CACHE_TIMEOUT = 86400
+
+# One keep-alive session so retries and later calls reuse the TLS connection.
+gemini_session = requests.Session()
+gemini_session.headers.update({'Content-Type': 'application/json'})
+gemini_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+# Gemini calls can take a minute with retries, so schedule generation runs on
+# a small worker pool and the client polls for the result by task id. Job
+# status lives in the shared cache (Redis when configured), so any worker can
+# answer a poll, and results nobody fetches expire on their own.
+schedule_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='exam-schedule')
+SCHEDULE_JOB_CACHE_KEY = 'exam_schedule_job:{}'
+SCHEDULE_JOB_TIMEOUT = 3600
+
 @exams_bp.route('/')
 def manage_exams():
     """Render the exam management page."""
@@ -28,23 +50,22 @@ def handle_exams(exam_id=None):
     
     try:
         if request.method == 'GET':
-            exams = Exam.query.options(
-                joinedload(Exam.subject),
-                joinedload(Exam.course)
-            ).all()
+            rows = db.session.query(
+                Exam.id, Exam.name, Exam.date, Exam.duration, Exam.type,
+                func.coalesce(Subject.name, Course.name, 'N/A'), func.coalesce(Subject.code, Course.code, 'N/A')
+            ).outerjoin(Subject, Subject.id == Exam.subject_id).outerjoin(Course, Course.id == Exam.course_id)
             
             exams_data = []
-            for exam in exams:
-                exam_data = {
-                    'id': exam.id,
-                    'name': exam.name,
-                    'date': exam.date.isoformat(),
-                    'duration': exam.duration,
-                    'type': exam.type,
-                    'subject_name': exam.subject.name if exam.subject else exam.course.name if exam.course else 'N/A',
-                    'subject_code': exam.subject.code if exam.subject else exam.course.code if exam.course else 'N/A'
-                }
-                exams_data.append(exam_data)
+            for item_id, name, date, duration, exam_type, subject_name, subject_code in rows:
+                exams_data.append({
+                    'id': item_id,
+                    'name': name,
+                    'date': date.isoformat(),
+                    'duration': duration,
+                    'type': exam_type,
+                    'subject_name': subject_name,
+                    'subject_code': subject_code
+                })
             
             return jsonify({"exams": exams_data})
         
@@ -74,7 +95,7 @@ def handle_exams(exam_id=None):
         
         elif request.method == 'PUT':
             # Update existing exam
-            exam = Exam.query.get_or_404(exam_id)
+            exam = db.get_or_404(Exam, exam_id)
             exam.name = data['name']
             exam.date = datetime.fromisoformat(data['date'].replace('Z', '+00:00'))
             exam.duration = data.get('duration', exam.duration)
@@ -89,7 +110,7 @@ def handle_exams(exam_id=None):
         
         elif request.method == 'DELETE':
             # Delete exam
-            exam = Exam.query.get_or_404(exam_id)
+            exam = db.get_or_404(Exam, exam_id)
             exam_name = exam.name
             
             # Delete associated seating plans
@@ -110,7 +131,7 @@ def handle_exams(exam_id=None):
 
 @exams_bp.route('/api/generate_schedule', methods=['POST'])
 def generate_exam_schedule():
-    """Generate exam schedule and seating plan using Gemini AI."""
+    """Queue exam schedule and seating plan generation using Gemini AI."""
     if 'user_id' not in session:
         return jsonify({"message": "Unauthorized"}), 401
     
@@ -123,123 +144,156 @@ def generate_exam_schedule():
         if not exam_ids:
             return jsonify({"message": "No exams selected for scheduling."}), 400
         
-        # Get exam data
-        exams = Exam.query.filter(Exam.id.in_(exam_ids)).options(
-            joinedload(Exam.subject),
-            joinedload(Exam.course)
-        ).all()
+        # Read only the columns the prompt needs; the rows are plain data the
+        # worker can use after this request's session is gone.
+        exams_data = [{
+            'id': item_id,
+            'name': name,
+            'duration': duration,
+            'type': exam_type,
+            'subject': subject_name,
+            'subject_code': subject_code
+        } for item_id, name, duration, exam_type, subject_name, subject_code in db.session.query(
+            Exam.id, Exam.name, Exam.duration, Exam.type,
+            func.coalesce(Subject.name, Course.name, 'N/A'), func.coalesce(Subject.code, Course.code, 'N/A')
+        ).outerjoin(Subject, Subject.id == Exam.subject_id).outerjoin(Course, Course.id == Exam.course_id).filter(Exam.id.in_(exam_ids))]
         
-        if not exams:
+        if not exams_data:
             return jsonify({"message": "No valid exams found."}), 400
         
-        # Get students data
-        students = Student.query.options(
-            joinedload(Student.user),
-            joinedload(Student.section)
-        ).all()
+        students_data = [{
+            'id': student_id,
+            'name': full_name,
+            'section': section_name or 'N/A',
+            'friends': []  # Could be populated from a friends table
+        } for student_id, full_name, section_name in db.session.query(Student.id, Student.full_name, StudentSection.name)
+            .outerjoin(StudentSection, StudentSection.id == Student.section_id)]
         
-        # Get classrooms data
-        classrooms = Classroom.query.all()
+        classrooms_data = [{
+            'id': item_id,
+            'room_id': room_id,
+            'capacity': capacity,
+            'features': features or []
+        } for item_id, room_id, capacity, features in db.session.query(Classroom.id, Classroom.room_id, Classroom.capacity, Classroom.features)]
         
-        # Generate prompt for Gemini
-        prompt = generate_exam_schedule_prompt(exams, students, classrooms)
+        prompt = generate_exam_schedule_prompt(exams_data, students_data, classrooms_data)
+        exam_rows = [(exam['id'], exam['name']) for exam in exams_data]
+        classroom_rows = [(classroom['id'], classroom['room_id']) for classroom in classrooms_data]
         
-        # Call Gemini API
-        schedule_data = call_gemini_api(prompt)
+        task_id = uuid.uuid4().hex
+        cache.set(SCHEDULE_JOB_CACHE_KEY.format(task_id), {"status": "pending"}, timeout=SCHEDULE_JOB_TIMEOUT)
+        schedule_executor.submit(run_schedule_job, current_app._get_current_object(), task_id, prompt, exam_rows, classroom_rows)
         
-        if schedule_data and 'exam_schedule' in schedule_data:
-            # Save exam schedule and seating plans
-            for schedule_item in schedule_data['exam_schedule']:
-                # Update exam with schedule
-                exam = next((e for e in exams if e.name == schedule_item['subject_id']), None)
-                if exam:
-                    exam.date = datetime.fromisoformat(schedule_item['date'])
-                    exam.duration = schedule_item.get('duration', 180)
-            
-            # Save seating plans
-            if 'seating_plan' in schedule_data:
-                for seating_item in schedule_data['seating_plan']:
-                    exam = next((e for e in exams if e.name == seating_item['exam_id'].split('-')[0]), None)
-                    if exam:
-                        # Clear existing seating for this exam
-                        ExamSeating.query.filter_by(exam_id=exam.id).delete()
-                        
-                        # Add new seating plan
-                        for row_idx, row in enumerate(seating_item['map']):
-                            for col_idx, student_id in enumerate(row):
-                                if student_id:
-                                    classroom = next((c for c in classrooms if c.room_id == seating_item['room_id']), None)
-                                    if classroom:
-                                        seating = ExamSeating(
-                                            exam_id=exam.id,
-                                            student_id=student_id,
-                                            classroom_id=classroom.id,
-                                            seat_number=f"{row_idx + 1}-{col_idx + 1}"
-                                        )
-                                        db.session.add(seating)
-            
-            db.session.commit()
-            
-            log_activity('info', f"Exam schedule generated for {len(exams)} exams.")
-            return jsonify({
-                "message": f"Exam schedule generated successfully!",
-                "schedule": schedule_data.get('exam_schedule', []),
-                "changes": schedule_data.get('explanation_of_changes', [])
-            })
-        else:
-            raise ValueError("Invalid response from Gemini API")
+        return jsonify({"message": "Exam schedule generation started.", "task_id": task_id}), 202
             
     except Exception as e:
-        db.session.rollback()
         log_activity('error', f'Exam schedule generation failed: {e}')
         return jsonify({"message": f"Failed to generate exam schedule: {str(e)}"}), 500
 
-def generate_exam_schedule_prompt(exams, students, classrooms):
-    """Generate prompt for Gemini API to create exam schedule."""
+@exams_bp.route('/api/generate_schedule/<task_id>', methods=['GET'])
+def get_schedule_status(task_id):
+    """Report the state of a queued schedule generation."""
+    if 'user_id' not in session:
+        return jsonify({"message": "Unauthorized"}), 401
+    
+    key = SCHEDULE_JOB_CACHE_KEY.format(task_id)
+    job = cache.get(key)
+    if job is None:
+        return jsonify({"message": "Unknown schedule task."}), 404
+    # Finished jobs are reported once and then forgotten.
+    if job['status'] in ('done', 'failed'):
+        cache.delete(key)
+    return jsonify(job)
+
+def run_schedule_job(app, task_id, prompt, exam_rows, classroom_rows):
+    """Call Gemini and save the returned schedule in a session of its own."""
+    key = SCHEDULE_JOB_CACHE_KEY.format(task_id)
+    with app.app_context():
+        cache.set(key, {"status": "running"}, timeout=SCHEDULE_JOB_TIMEOUT)
+        try:
+            schedule_data = call_gemini_api(prompt)
+            if not schedule_data or 'exam_schedule' not in schedule_data:
+                raise ValueError("Invalid response from Gemini API")
+            
+            save_exam_schedule(schedule_data, exam_rows, classroom_rows)
+            log_activity('info', f"Exam schedule generated for {len(exam_rows)} exams.")
+            result = {
+                "status": "done",
+                "message": "Exam schedule generated successfully!",
+                "schedule": schedule_data.get('exam_schedule', []),
+                "changes": schedule_data.get('explanation_of_changes', [])
+            }
+        except Exception as e:
+            db.session.rollback()
+            log_activity('error', f'Exam schedule generation failed: {e}')
+            result = {"status": "failed", "message": f"Failed to generate exam schedule: {str(e)}"}
+        cache.set(key, result, timeout=SCHEDULE_JOB_TIMEOUT)
+
+def save_exam_schedule(schedule_data, exam_rows, classroom_rows):
+    """Apply Gemini's exam dates and replace the seating of every planned exam."""
+    exams_by_name = {}
+    for item_id, name in exam_rows:
+        exams_by_name.setdefault(name, item_id)
+    classroom_by_room = {}
+    for item_id, room_id in classroom_rows:
+        classroom_by_room.setdefault(room_id, item_id)
     
-    exams_data = []
-    for exam in exams:
-        exam_info = {
-            'id': exam.id,
-            'name': exam.name,
-            'duration': exam.duration,
-            'type': exam.type,
-            'subject': exam.subject.name if exam.subject else exam.course.name if exam.course else 'N/A',
-            'subject_code': exam.subject.code if exam.subject else exam.course.code if exam.course else 'N/A'
-        }
-        exams_data.append(exam_info)
+    # Save exam schedule
+    exam_updates = {}
+    for schedule_item in schedule_data['exam_schedule']:
+        exam_id = exams_by_name.get(schedule_item['subject_id'])
+        if exam_id:
+            exam_updates[exam_id] = {
+                'id': exam_id,
+                'date': datetime.fromisoformat(schedule_item['date']),
+                'duration': schedule_item.get('duration', 180)
+            }
+    if exam_updates:
+        db.session.bulk_update_mappings(Exam, list(exam_updates.values()))
     
-    students_data = []
-    for student in students:
-        student_info = {
-            'id': student.id,
-            'name': student.full_name,
-            'section': student.section.name if student.section else 'N/A',
-            'friends': []  # Could be populated from a friends table
-        }
-        students_data.append(student_info)
+    # Save seating plans
+    if 'seating_plan' in schedule_data:
+        seat_rows = []
+        exam_ids_touched = set()
+        for seating_item in schedule_data['seating_plan']:
+            exam_id = exams_by_name.get(seating_item['exam_id'].split('-')[0])
+            if exam_id:
+                exam_ids_touched.add(exam_id)
+                classroom_id = classroom_by_room.get(seating_item['room_id'])
+                if not classroom_id:
+                    continue
+                for row_idx, row in enumerate(seating_item['map']):
+                    for col_idx, student_id in enumerate(row):
+                        if student_id:
+                            seat_rows.append({
+                                'exam_id': exam_id,
+                                'student_id': student_id,
+                                'classroom_id': classroom_id,
+                                'seat_number': f"{row_idx + 1}-{col_idx + 1}"
+                            })
+        
+        # Replace the seating of every exam in the plan in two statements
+        if exam_ids_touched:
+            ExamSeating.query.filter(ExamSeating.exam_id.in_(exam_ids_touched)).delete(synchronize_session=False)
+        if seat_rows:
+            db.session.execute(ExamSeating.__table__.insert(), seat_rows)
     
-    classrooms_data = []
-    for classroom in classrooms:
-        classroom_info = {
-            'id': classroom.id,
-            'room_id': classroom.room_id,
-            'capacity': classroom.capacity,
-            'features': classroom.features or []
-        }
-        classrooms_data.append(classroom_info)
+    db.session.commit()
+
+def generate_exam_schedule_prompt(exams_data, students_data, classrooms_data):
+    """Generate prompt for Gemini API to create exam schedule."""
     
     prompt = f"""
 You are an expert exam logistics coordinator for an Indian educational institution. Generate an optimal exam schedule and seating plan based on the following data:
 
 EXAMS TO SCHEDULE ({len(exams_data)}):
-{json.dumps(exams_data, indent=2)}
+{orjson.dumps(exams_data, option=orjson.OPT_INDENT_2).decode()}
 
 STUDENTS ({len(students_data)}):
-{json.dumps(students_data, indent=2)}
+{orjson.dumps(students_data, option=orjson.OPT_INDENT_2).decode()}
 
 AVAILABLE CLASSROOMS ({len(classrooms_data)}):
-{json.dumps(classrooms_data, indent=2)}
+{orjson.dumps(classrooms_data, option=orjson.OPT_INDENT_2).decode()}
 
 REQUIREMENTS:
 1. No student can have two exams at the same time
@@ -284,7 +338,10 @@ Return ONLY the JSON object, no additional text.
 
 def call_gemini_api(prompt, max_retries=3):
     """Call Gemini API to generate exam schedule with retry logic for rate limits."""
-    import time
+    cache_key = f"gemini:{hashlib.blake2b(prompt.encode()).hexdigest()}"
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return orjson.loads(cached)
     
     api_key = os.getenv('GEMINI_API_KEY')
     if not api_key:
@@ -292,10 +349,6 @@ def call_gemini_api(prompt, max_retries=3):
     
     url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent?key={api_key}"
     
-    headers = {
-        'Content-Type': 'application/json',
-    }
-    
     data = {
         "contents": [{
             "parts": [{
@@ -306,7 +359,7 @@ def call_gemini_api(prompt, max_retries=3):
     
     for attempt in range(max_retries):
         try:
-            response = requests.post(url, headers=headers, json=data, timeout=60)
+            response = gemini_session.post(url, json=data, timeout=60)
             
             # Handle rate limit specifically
             if response.status_code == 429:
@@ -330,7 +383,9 @@ def call_gemini_api(prompt, max_retries=3):
                 if content.endswith('```'):
                     content = content[:-3]
                 
-                return json.loads(content)
+                schedule_data = orjson.loads(content)
+                cache.set(cache_key, content, timeout=GEMINI_CACHE_TIMEOUT)
+                return schedule_data
             else:
                 raise ValueError("No valid response from Gemini API")
                 
@@ -354,29 +409,26 @@ def get_seating_plan(exam_id):
         return jsonify({"message": "Unauthorized"}), 401
     
     try:
-        exam = Exam.query.get_or_404(exam_id)
-        seating_plans = ExamSeating.query.filter_by(exam_id=exam_id).options(
-            joinedload(ExamSeating.student),
-            joinedload(ExamSeating.classroom)
-        ).all()
+        exam = db.get_or_404(Exam, exam_id)
+        seats = db.session.query(
+            Classroom.room_id, Classroom.capacity, ExamSeating.seat_number, ExamSeating.student_id, Student.full_name
+        ).join(Classroom, Classroom.id == ExamSeating.classroom_id) \
+            .join(Student, Student.id == ExamSeating.student_id) \
+            .filter(ExamSeating.exam_id == exam_id) \
+            .order_by(Classroom.room_id, ExamSeating.seat_number)
         
-        # Group by classroom
+        # Rows arrive ordered by room, so each classroom is built from one run of rows
         classrooms = {}
-        for seating in seating_plans:
-            room_id = seating.classroom.room_id
-            if room_id not in classrooms:
-                classrooms[room_id] = {
-                    'room_id': room_id,
-                    'capacity': seating.classroom.capacity,
-                    'seats': {}
+        for room_id, room_seats in groupby(seats, key=itemgetter(0)):
+            classroom = classrooms[room_id] = {'room_id': room_id, 'seats': {}}
+            for _, capacity, seat_number, student_id, full_name in room_seats:
+                classroom['capacity'] = capacity
+                # seat_number is already the "row-col" key the seating plan uses
+                classroom['seats'][seat_number] = {
+                    'student_id': student_id,
+                    'student_name': full_name,
+                    'seat_number': seat_number
                 }
-            
-            row, col = seating.seat_number.split('-')
-            classrooms[room_id]['seats'][f"{row}-{col}"] = {
-                'student_id': seating.student_id,
-                'student_name': seating.student.full_name,
-                'seat_number': seating.seat_number
-            }
         
         return jsonify({
             "exam_name": exam.name,
@@ -1,11 +1,15 @@
 import json
+import orjson
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from flask import Blueprint, render_template, request, redirect, url_for, session, g, flash, jsonify
-from sqlalchemy import exc
+from flask import Blueprint, render_template, request, redirect, url_for, session, g, flash, jsonify, current_app
+from sqlalchemy import exc, func
+from sqlalchemy.dialects import mysql, postgresql, sqlite
 
 from models import AppConfig, User, SchoolGroup, Grade, Stream, Subject, Semester, Department, Course, SystemMetric, ActivityLog, TimetableEntry
-from extensions import db
-from utils import hash_password, log_activity, calculate_growth, set_config
+from extensions import db, cache
+from utils import hash_password, log_activity, calculate_growths, set_config, invalidate_dashboard_cache, DASHBOARD_CACHE_KEY, DASHBOARD_CACHE_TIMEOUT
+from routes.subjects import count_subject_items, invalidate_subject_cache
 from werkzeug.security import check_password_hash
 
 main_bp = Blueprint('main', __name__)
@@ -29,7 +33,7 @@ def setup():
     if request.method == 'POST':
         try:
             payload_str = request.form.get('payload')
-            data = json.loads(payload_str)
+            data = orjson.loads(payload_str)
             
             with db.session.begin_nested():
                 admin_data = data['admin']
@@ -49,43 +53,62 @@ def setup():
                 ]
                 db.session.add_all(configs)
 
+                # Parents go through the session in one flush to get their ids;
+                # leaf rows are then written with one executemany per table.
+                leaf_rows = []
                 if data['mode'] == 'school':
+                    groups, streams = [], []
                     for group_data in data['structure']:
                         new_group = SchoolGroup(name=group_data['name'])
                         db.session.add(new_group)
-                        db.session.flush()
-                        for grade_data in group_data['grades']:
-                            db.session.add(Grade(name=grade_data['name'], group_id=new_group.id))
+                        groups.append((new_group, group_data['grades']))
                         for stream_data in group_data['streams']:
-                            new_stream = Stream(name=stream_data['name'], group_id=new_group.id)
+                            new_stream = Stream(name=stream_data['name'], group=new_group)
                             db.session.add(new_stream)
-                            db.session.flush()
-                            for subject_data in stream_data['subjects']:
-                                db.session.add(Subject(name=subject_data['name'], code=subject_data['code'], weekly_hours=subject_data['hours'], is_elective=subject_data['is_elective'], stream_id=new_stream.id))
+                            streams.append((new_stream, stream_data['subjects']))
+                    db.session.flush()
+                    
+                    leaf_rows.append((Grade, [{'name': grade_data['name'], 'group_id': new_group.id}
+                                              for new_group, grades in groups for grade_data in grades]))
+                    leaf_rows.append((Subject, [{'name': subject_data['name'], 'code': subject_data['code'], 'weekly_hours': subject_data['hours'], 'is_elective': subject_data['is_elective'], 'stream_id': new_stream.id}
+                                                for new_stream, subjects in streams for subject_data in subjects]))
                 
                 elif data['mode'] == 'college':
+                    departments = []
                     for sem_data in data['structure']:
                         new_sem = Semester(name=sem_data['name'])
                         db.session.add(new_sem)
-                        db.session.flush()
                         for dept_data in sem_data['departments']:
-                            new_dept = Department(name=dept_data['name'], semester_id=new_sem.id)
+                            new_dept = Department(name=dept_data['name'], semester=new_sem)
                             db.session.add(new_dept)
-                            db.session.flush()
-                            for course_data in dept_data['courses']:
-                                db.session.add(Course(name=course_data['name'], code=course_data['code'], credits=course_data['credits'], course_type=course_data['type'], department_id=new_dept.id))
+                            departments.append((new_dept, dept_data['courses']))
+                    db.session.flush()
+                    
+                    leaf_rows.append((Course, [{'name': course_data['name'], 'code': course_data['code'], 'credits': course_data['credits'], 'course_type': course_data['type'], 'department_id': new_dept.id}
+                                               for new_dept, courses in departments for course_data in courses]))
+                
+                for model, rows in leaf_rows:
+                    if rows:
+                        db.session.execute(model.__table__.insert(), rows)
                 
                 db.session.add(AppConfig(key='setup_complete', value='true'))
 
+                total_subjects = db.session.query(
+                    db.session.query(func.count(Subject.id)).scalar_subquery() + db.session.query(func.count(Course.id)).scalar_subquery()
+                ).scalar()
+                today = datetime.now(timezone.utc).date()
+                db.session.execute(upsert_metrics([
+                    {'key': 'total_students', 'value': 0, 'date': today},
+                    {'key': 'total_teachers', 'value': 0, 'date': today},
+                    {'key': 'total_subjects', 'value': total_subjects, 'date': today},
+                    {'key': 'classes_scheduled', 'value': 0, 'date': today},
+                ]))
+
             db.session.commit()
+            invalidate_subject_cache()
+            invalidate_dashboard_cache()
             log_activity('info', f"System setup completed for {details['institute_name']}.")
             
-            db.session.add(SystemMetric(key='total_students', value=0))
-            db.session.add(SystemMetric(key='total_teachers', value=0))
-            db.session.add(SystemMetric(key='total_subjects', value=Subject.query.count() + Course.query.count()))
-            db.session.add(SystemMetric(key='classes_scheduled', value=0))
-            db.session.commit()
-            
             flash('Setup complete! Please log in with your new admin account.', 'success')
             return jsonify({'status': 'success', 'redirect': url_for('main.login')})
 
@@ -119,57 +142,96 @@ def logout():
     flash('You have been logged out.', 'success')
     return redirect(url_for('main.login'))
 
+# (SystemMetric key, stats key, growth key) for each dashboard counter
+DASHBOARD_METRICS = [
+    ('total_students', 'total_students', 'students_growth'),
+    ('total_teachers', 'teachers', 'teachers_growth'),
+    ('total_subjects', 'subjects', 'subjects_growth'),
+    ('classes_scheduled', 'classes_scheduled', 'scheduled_growth'),
+]
+
+# Today's metric snapshot is written by a single background worker, so page
+# views never wait on the write. The write is one upsert against the unique
+# (key, date) index, so snapshots from several workers cannot duplicate a day.
+metrics_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='metric-snapshot')
+
+# The values last written for a day; views that would write the same values again skip the submit.
+METRIC_SNAPSHOT_CACHE_KEY = 'metric_snapshot:{}'
+METRIC_SNAPSHOT_CACHE_TIMEOUT = 24 * 3600
+
+def upsert_metrics(rows):
+    """Build an insert of metric rows that overwrites the value of an existing (key, date) snapshot."""
+    dialect = db.engine.dialect.name
+    if dialect == 'mysql':
+        statement = mysql.insert(SystemMetric).values(rows)
+        return statement.on_duplicate_key_update(value=statement.inserted.value)
+    statement = (postgresql if dialect == 'postgresql' else sqlite).insert(SystemMetric).values(rows)
+    return statement.on_conflict_do_update(index_elements=['key', 'date'], set_={'value': statement.excluded.value})
+
+def snapshot_metrics(app, current_values):
+    """Store today's value of each dashboard counter in its own session."""
+    with app.app_context():
+        try:
+            today = datetime.now(timezone.utc).date()
+            db.session.execute(upsert_metrics([{'key': metric_key, 'value': current_value, 'date': today}
+                                               for metric_key, current_value in current_values.items()]))
+            db.session.commit()
+            cache.set(METRIC_SNAPSHOT_CACHE_KEY.format(today), current_values, timeout=METRIC_SNAPSHOT_CACHE_TIMEOUT)
+        except Exception as e:
+            db.session.rollback()
+            log_activity('error', f"Failed to record dashboard metrics: {e}")
+
+def load_dashboard_counts(app_mode):
+    """Count teachers, students and timetable entries in one round-trip; the catalog size comes from the cache."""
+    def count(model, *criteria):
+        return db.session.query(func.count(model.id)).filter(*criteria).scalar_subquery()
+    teachers, students, scheduled = db.session.query(
+        count(User, User.role == 'teacher'),
+        count(User, User.role == 'student'),
+        count(TimetableEntry),
+    ).one()
+    return {'teachers': teachers, 'total_students': students, 'classes_scheduled': scheduled, 'subjects': count_subject_items(app_mode)}
+
+def add_growth(stats):
+    """Add the *_growth percentages for the dashboard counters to stats."""
+    growths = calculate_growths({metric_key: stats[stat_key] for metric_key, stat_key, _ in DASHBOARD_METRICS})
+    for metric_key, _, growth_key in DASHBOARD_METRICS:
+        stats[growth_key] = growths[metric_key]
+
+def load_dashboard_stats(app_mode):
+    """Return the dashboard counters with their growth, computed at most once a minute per mode."""
+    key = DASHBOARD_CACHE_KEY.format(app_mode)
+    stats = cache.get(key)
+    if stats is None:
+        stats = load_dashboard_counts(app_mode)
+        add_growth(stats)
+        cache.set(key, stats, timeout=DASHBOARD_CACHE_TIMEOUT)
+    return dict(stats)
+
+def load_performance_configs():
+    """Read the last schedule accuracy and generation time settings in one query."""
+    return dict(db.session.query(AppConfig.key, AppConfig.value)
+                .filter(AppConfig.key.in_(['last_schedule_accuracy', 'last_generation_time'])))
+
 @main_bp.route('/dashboard')
 def dashboard():
     if 'user_id' not in session:
         return redirect(url_for('main.login'))
     
-    # Get current statistics
-    stats = {
-        'teachers': User.query.filter_by(role='teacher').count(),
-        'total_students': User.query.filter_by(role='student').count(),
-        'classes_scheduled': TimetableEntry.query.count(),
-    }
-    if g.app_mode == 'school':
-        stats['subjects'] = Subject.query.count()
-    else:
-        stats['subjects'] = Course.query.count()
+    stats = load_dashboard_stats(g.app_mode)
 
-    # Update system metrics for growth calculation
-    today = datetime.now(timezone.utc).date()
-    
-    # Update or create metrics for today
-    metrics_to_update = [
-        ('total_students', stats['total_students']),
-        ('total_teachers', stats['teachers']),
-        ('total_subjects', stats['subjects']),
-        ('classes_scheduled', stats['classes_scheduled'])
-    ]
-    
-    for metric_key, current_value in metrics_to_update:
-        existing_metric = SystemMetric.query.filter_by(key=metric_key, date=today).first()
-        if existing_metric:
-            existing_metric.value = current_value
-        else:
-            new_metric = SystemMetric(key=metric_key, value=current_value, date=today)
-            db.session.add(new_metric)
-    
-    db.session.commit()
-
-    # Calculate growth percentages
-    stats['students_growth'] = calculate_growth('total_students', stats['total_students'])
-    stats['teachers_growth'] = calculate_growth('total_teachers', stats['teachers'])
-    stats['subjects_growth'] = calculate_growth('total_subjects', stats['subjects'])
-    stats['scheduled_growth'] = calculate_growth('classes_scheduled', stats['classes_scheduled'])
+    # Update or create metrics for today off the request thread, unless today's snapshot already holds these values
+    current_values = {metric_key: stats[stat_key] for metric_key, stat_key, _ in DASHBOARD_METRICS}
+    if cache.get(METRIC_SNAPSHOT_CACHE_KEY.format(datetime.now(timezone.utc).date())) != current_values:
+        metrics_executor.submit(snapshot_metrics, current_app._get_current_object(), current_values)
 
     recent_activities = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).limit(5).all()
+    configs = load_performance_configs()
     performance = {
-        'accuracy': AppConfig.query.filter_by(key='last_schedule_accuracy').first(),
-        'gen_time': AppConfig.query.filter_by(key='last_generation_time').first(),
+        'accuracy': float(configs['last_schedule_accuracy']) if 'last_schedule_accuracy' in configs else 0,
+        'gen_time': float(configs['last_generation_time']) if 'last_generation_time' in configs else 0,
+        'uptime': 99.9,
     }
-    performance['accuracy'] = float(performance['accuracy'].value) if performance['accuracy'] else 0
-    performance['gen_time'] = float(performance['gen_time'].value) if performance['gen_time'] else 0
-    performance['uptime'] = 99.9
 
     return render_template('dashboard.html', stats=stats, activities=recent_activities, performance=performance)
 
@@ -180,30 +242,15 @@ def get_dashboard_stats():
         return jsonify({'success': False, 'error': 'Unauthorized'}), 401
     
     try:
-        # Get real-time statistics
-        stats = {
-            'teachers': User.query.filter_by(role='teacher').count(),
-            'total_students': User.query.filter_by(role='student').count(),
-            'classes_scheduled': TimetableEntry.query.count(),
-        }
-        if g.app_mode == 'school':
-            stats['subjects'] = Subject.query.count()
-        else:
-            stats['subjects'] = Course.query.count()
-
-        # Calculate growth percentages with fallback
-        stats['students_growth'] = calculate_growth('total_students', stats['total_students']) or 0
-        stats['teachers_growth'] = calculate_growth('total_teachers', stats['teachers']) or 0
-        stats['subjects_growth'] = calculate_growth('total_subjects', stats['subjects']) or 0
-        stats['scheduled_growth'] = calculate_growth('classes_scheduled', stats['classes_scheduled']) or 0
+        # Get statistics with growth percentages
+        stats = load_dashboard_stats(g.app_mode)
 
         # Get performance metrics
-        accuracy_config = AppConfig.query.filter_by(key='last_schedule_accuracy').first()
-        gen_time_config = AppConfig.query.filter_by(key='last_generation_time').first()
+        configs = load_performance_configs()
         
         performance = {
-            'accuracy': float(accuracy_config.value) if accuracy_config else 95.0,
-            'gen_time': float(gen_time_config.value) if gen_time_config else 2.5,
+            'accuracy': float(configs['last_schedule_accuracy']) if 'last_schedule_accuracy' in configs else 95.0,
+            'gen_time': float(configs['last_generation_time']) if 'last_generation_time' in configs else 2.5,
             'uptime': 99.9
         }
         
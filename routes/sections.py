@@ -1,45 +1,55 @@
 import io
 import csv
-import random
-from flask import Blueprint, jsonify, request, session, redirect, url_for, render_template, g, send_file
-from sqlalchemy import exc
+import logging
+from collections import defaultdict
+from flask import Blueprint, jsonify, request, session, redirect, url_for, render_template, g, send_file, Response
+from sqlalchemy import func
 
-from extensions import db
-from models import User, Student, StudentSection, Semester, Department, Course, Subject
-from utils import hash_password, generate_random_password, log_activity
+from extensions import db, cache
+from models import User, Student, StudentSection, Semester, Department, Course, Subject, student_electives_association
+from utils import hash_password, generate_random_password, log_activity, rollback_on_error, invalidate_dashboard_cache, invalidate_timetable_export, USER_CONFLICTS
 
 sections_bp = Blueprint('sections', __name__)
+logger = logging.getLogger(__name__)
 
-def find_or_create_section(section_name, department_id=None, grade_id=None):
-    """Seamlessly find or create section - the best in the world!"""
-    print(f"Looking for section: '{section_name}' in department_id: {department_id}, grade_id: {grade_id}")
+# Rows per IN (...) lookup, kept well under SQLite's bound-parameter limit
+BULK_LOOKUP_BATCH_SIZE = 500
+
+# Pre-encoded body for section listings without a parent
+EMPTY_SECTIONS_JSON = b'{"sections":[]}'
+
+# Strips whitespace from full names when deriving usernames
+WHITESPACE_TABLE = str.maketrans('', '', ' \t\n\r\f\v')
+
+def find_or_create_section(section_name, sections, occupancy, name_counts, department_id=None, grade_id=None):
+    """Seamlessly find or create section - the best in the world!
+
+    sections maps (name, grade or department id) to the sections loaded up
+    front, and occupancy maps section ids to their student count, including
+    students queued but not yet written. name_counts caches how many sections
+    share a name prefix for overflow naming. New sections update both.
+    """
+    logger.debug("Looking for section: '%s' in department_id: %s, grade_id: %s", section_name, department_id, grade_id)
     
     # Find existing section with available capacity
-    if g.app_mode == 'school':
-        existing_section = StudentSection.query.filter_by(
-            name=section_name, 
-            grade_id=grade_id
-        ).first()
-    else:  # college
-        existing_section = StudentSection.query.filter_by(
-            name=section_name, 
-            department_id=department_id
-        ).first()
+    parent_id = grade_id if g.app_mode == 'school' else department_id
+    existing_section = sections.get((section_name, parent_id))
     
     if existing_section:
-        current_students = len(existing_section.students)
-        print(f"Found existing section '{section_name}' with {current_students}/{existing_section.capacity} students")
+        current_students = occupancy[existing_section.id]
+        logger.debug("Found existing section '%s' with %s/%s students", section_name, current_students, existing_section.capacity)
         
         if current_students < existing_section.capacity:
-            print(f"Section has capacity, using existing section")
+            logger.debug("Section has capacity, using existing section")
             return existing_section
         else:
             # Section is full, create a new one with incremental naming
-            section_count = StudentSection.query.filter(
-                StudentSection.name.like(f"{section_name}%")
-            ).count()
-            new_section_name = f"{section_name} - {section_count + 1}"
-            print(f"Section full, creating new section: '{new_section_name}'")
+            if section_name not in name_counts:
+                name_counts[section_name] = StudentSection.query.filter(
+                    StudentSection.name.like(f"{section_name}%")
+                ).count()
+            new_section_name = f"{section_name} - {name_counts[section_name] + 1}"
+            logger.debug("Section full, creating new section: '%s'", new_section_name)
             
             if g.app_mode == 'school':
                 new_section = StudentSection(name=new_section_name, capacity=30, grade_id=grade_id)
@@ -48,11 +58,14 @@ def find_or_create_section(section_name, department_id=None, grade_id=None):
             
             db.session.add(new_section)
             db.session.flush()
-            print(f"Created new section: '{new_section_name}' with ID: {new_section.id}")
+            sections.setdefault((new_section_name, parent_id), new_section)
+            for prefix in name_counts:
+                if new_section_name.startswith(prefix): name_counts[prefix] += 1
+            logger.debug("Created new section: '%s' with ID: %s", new_section_name, new_section.id)
             return new_section
     else:
         # Section doesn't exist, create it
-        print(f"Section '{section_name}' doesn't exist, creating new one")
+        logger.debug("Section '%s' doesn't exist, creating new one", section_name)
         
         if g.app_mode == 'school':
             new_section = StudentSection(name=section_name, capacity=30, grade_id=grade_id)
@@ -61,9 +74,30 @@ def find_or_create_section(section_name, department_id=None, grade_id=None):
         
         db.session.add(new_section)
         db.session.flush()
-        print(f"Created new section: '{section_name}' with ID: {new_section.id}")
+        sections[(section_name, parent_id)] = new_section
+        for prefix in name_counts:
+            if section_name.startswith(prefix): name_counts[prefix] += 1
+        logger.debug("Created new section: '%s' with ID: %s", section_name, new_section.id)
         return new_section
 
+def find_electives(electives):
+    """Resolve a comma-separated list of elective names with a single query.
+
+    Unknown names are skipped; when names repeat in the catalogue the
+    earliest row wins, as the old per-name .first() lookups did.
+    """
+    names = [name.strip() for name in electives.split(',') if name.strip()]
+    if not names:
+        return []
+    if g.app_mode == 'school':
+        query = Subject.query.filter(Subject.name.in_(names), Subject.is_elective == True).order_by(Subject.id)
+    else:  # college
+        query = Course.query.filter(Course.name.in_(names), Course.course_type == 'elective').order_by(Course.id)
+    by_name = {}
+    for elective in query:
+        by_name.setdefault(elective.name, elective)
+    return [by_name[name] for name in names if name in by_name]
+
 @sections_bp.route('/sections')
 def manage_sections():
     if 'user_id' not in session:
@@ -72,177 +106,147 @@ def manage_sections():
 
 @sections_bp.route('/api/sections', methods=['GET', 'POST'])
 @sections_bp.route('/api/sections/<int:section_id>', methods=['PUT', 'DELETE'])
+@rollback_on_error(error_message="An unexpected server error occurred.")
 def handle_sections(section_id=None):
     if 'user_id' not in session:
         return jsonify({"message": "Unauthorized"}), 401
     
-    try:
-        if request.method == 'GET':
-            parent_id = request.args.get('parent_id', type=int)
-            if not parent_id: return jsonify({"sections": []})
-            
-            query = StudentSection.query.options(
-                db.joinedload(StudentSection.students).joinedload(Student.user),
-                db.joinedload(StudentSection.students).joinedload(Student.electives)
-            )
-            if g.app_mode == 'school':
-                sections = query.filter_by(grade_id=parent_id).order_by(StudentSection.name).all()
-            else: # college
-                sections = query.filter_by(department_id=parent_id).order_by(StudentSection.name).all()
-
-            section_list = []
-            for s in sections:
-                section_list.append({
-                    "id": s.id, "name": s.name, "capacity": s.capacity,
-                    "students": sorted([{
-                        "id": stu.id, 
-                        "full_name": stu.full_name, 
-                        "user": {"username": stu.user.username, "email": stu.user.email},
-                        "electives": [{"id": e.id, "name": e.name} for e in stu.electives]
-                    } for stu in s.students], key=lambda x: x['full_name'])
-                })
-            return jsonify({"sections": section_list})
-
-        data = request.json if request.method in ['POST', 'PUT'] else None
-        if request.method in ['POST', 'PUT'] and (not data.get('name') or data.get('capacity') is None):
-            return jsonify({"message": "Name and Capacity are required."}), 400
-
-        if request.method == 'POST':
-            new_section = StudentSection(name=data['name'], capacity=data['capacity'])
-            if g.app_mode == 'school': new_section.grade_id = data['grade_id']
-            else: new_section.department_id = data['department_id']
-            db.session.add(new_section)
-            message = f"{'Section' if g.app_mode == 'school' else 'Batch'} created."
-            log_activity('info', message)
-
-        else: # PUT or DELETE
-            section = StudentSection.query.get_or_404(section_id)
-            if request.method == 'PUT':
-                section.name = data['name']
-                section.capacity = data['capacity']
-                message = f"{'Section' if g.app_mode == 'school' else 'Batch'} updated."
-                log_activity('info', f"{'Section' if g.app_mode == 'school' else 'Batch'} '{section.name}' updated.")
-            
-            elif request.method == 'DELETE':
-                print(f"DELETE request received for section ID: {section_id}")
-                print(f"Deleting section: {section.name} with {len(section.students)} students")
-                
-                # Unassign all students from this section
-                for student in section.students: 
-                    student.section_id = None
-                    print(f"Unassigned student: {student.full_name}")
-                
-                # Delete the section
-                db.session.delete(section)
-                message = f"{'Section' if g.app_mode == 'school' else 'Batch'} deleted."
-                log_activity('warning', f"Section '{section.name}' deleted.")
-                print(f"Section {section.name} deleted successfully")
+    if request.method == 'GET':
+        parent_id = request.args.get('parent_id', type=int)
+        if not parent_id: return Response(EMPTY_SECTIONS_JSON, mimetype='application/json')
         
-        db.session.commit()
-        return jsonify({"message": message})
+        in_parent = StudentSection.grade_id == parent_id if g.app_mode == 'school' else StudentSection.department_id == parent_id
+
+        # Electives per student and students per section, read as plain columns
+        chosen = defaultdict(list)
+        choices = db.session.query(student_electives_association.c.student_id, Subject.id, Subject.name) \
+            .join(Subject, Subject.id == student_electives_association.c.subject_id) \
+            .join(Student, Student.id == student_electives_association.c.student_id) \
+            .join(StudentSection, StudentSection.id == Student.section_id).filter(in_parent)
+        for student_id, subject_id, name in choices:
+            chosen[student_id].append({"id": subject_id, "name": name})
+
+        students = defaultdict(list)
+        rows = db.session.query(Student.section_id, Student.id, Student.full_name, User.username, User.email) \
+            .join(User, User.id == Student.user_id) \
+            .join(StudentSection, StudentSection.id == Student.section_id).filter(in_parent) \
+            .order_by(Student.full_name)
+        for item_id, student_id, full_name, username, email in rows:
+            students[item_id].append({
+                "id": student_id,
+                "full_name": full_name,
+                "user": {"username": username, "email": email},
+                "electives": chosen[student_id]
+            })
+
+        sections = db.session.query(StudentSection.id, StudentSection.name, StudentSection.capacity) \
+            .filter(in_parent).order_by(StudentSection.name)
+        return jsonify({"sections": [
+            {"id": item_id, "name": name, "capacity": capacity, "students": students[item_id]}
+            for item_id, name, capacity in sections
+        ]})
+
+    data = request.json if request.method in ['POST', 'PUT'] else None
+    if request.method in ['POST', 'PUT'] and (not data.get('name') or data.get('capacity') is None):
+        return jsonify({"message": "Name and Capacity are required."}), 400
+
+    if request.method == 'POST':
+        new_section = StudentSection(name=data['name'], capacity=data['capacity'])
+        if g.app_mode == 'school': new_section.grade_id = data['grade_id']
+        else: new_section.department_id = data['department_id']
+        db.session.add(new_section)
+        message = f"{'Section' if g.app_mode == 'school' else 'Batch'} created."
+        activity = ('info', message)
+
+    else: # PUT or DELETE
+        section = db.get_or_404(StudentSection, section_id)
+        if request.method == 'PUT':
+            section.name = data['name']
+            section.capacity = data['capacity']
+            message = f"{'Section' if g.app_mode == 'school' else 'Batch'} updated."
+            activity = ('info', f"{'Section' if g.app_mode == 'school' else 'Batch'} '{section.name}' updated.")
         
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"message": "An unexpected server error occurred."}), 500
+        elif request.method == 'DELETE':
+            logger.debug("DELETE request received for section ID: %s", section_id)
+            logger.debug("Deleting section: %s", section.name)
+            
+            # Unassign all students from this section in one UPDATE
+            unassigned = Student.query.filter_by(section_id=section.id).update({Student.section_id: None}, synchronize_session='fetch')
+            logger.debug("Unassigned %s students", unassigned)
+            
+            # Delete the section
+            db.session.delete(section)
+            message = f"{'Section' if g.app_mode == 'school' else 'Batch'} deleted."
+            activity = ('warning', f"Section '{section.name}' deleted.")
+            logger.debug("Section %s deleted successfully", section.name)
+    
+    db.session.commit()
+    invalidate_timetable_export()
+    log_activity(*activity)
+    if request.method in ('PUT', 'DELETE'):
+        return "", 204
+    return jsonify({"message": message})
 
 @sections_bp.route('/api/students', methods=['POST'])
 @sections_bp.route('/api/students/<int:student_id>', methods=['PUT', 'DELETE'])
+@rollback_on_error("Database integrity error. Check for duplicate data.", conflicts=USER_CONFLICTS)
 def handle_students(student_id=None):
     if 'user_id' not in session: return jsonify({"message": "Unauthorized"}), 401
 
-    try:
-        data = request.json if request.method in ['POST', 'PUT'] else None
-        if request.method in ['POST', 'PUT']:
-            if not data.get('full_name') or not data.get('username') or not data.get('section_id'):
-                return jsonify({"message": "Full Name, Username, and Section are required."}), 400
-
-        if request.method == 'POST':
-            # Use username as password if password is not provided
-            password = data.get('password') or data['username']
-            if User.query.filter_by(username=data['username']).first(): return jsonify({"message": "Username already exists."}), 409
-            if data.get('email') and User.query.filter_by(email=data['email']).first(): return jsonify({"message": "Email already exists."}), 409
-
-            new_user = User(username=data['username'], email=data.get('email'), password=hash_password(password), role='student')
-            db.session.add(new_user)
-            db.session.flush()
+    data = request.json if request.method in ['POST', 'PUT'] else None
+    if request.method in ['POST', 'PUT']:
+        if not data.get('full_name') or not data.get('username') or not data.get('section_id'):
+            return jsonify({"message": "Full Name, Username, and Section are required."}), 400
+
+    if request.method == 'POST':
+        # Use username as password if password is not provided
+        password = data.get('password') or data['username']
+
+        new_user = User(username=data['username'], email=data.get('email'), password=hash_password(password), role='student')
+        db.session.add(new_user)
+        db.session.flush()
+
+        new_student = Student(full_name=data['full_name'], section_id=data['section_id'], user_id=new_user.id)
+        db.session.add(new_student)
+        
+        # Handle electives if provided
+        if data.get('electives'):
+            new_student.electives.extend(find_electives(data['electives']))
+        
+        message = "Student created successfully."
+        activity = ('info', f"Student '{data['full_name']}' created.")
 
-            new_student = Student(full_name=data['full_name'], section_id=data['section_id'], user_id=new_user.id)
-            db.session.add(new_student)
+    else: # PUT or DELETE
+        student = db.get_or_404(Student, student_id)
+        user = student.user
+
+        if request.method == 'PUT':
+            
+            user.username, user.email = data['username'], data.get('email')
+            if data.get('password'): user.password = hash_password(data['password'])
+            
+            student.full_name, student.section_id = data['full_name'], data['section_id']
             
-            # Handle electives if provided
+            # Handle electives update
+            student.electives.clear()  # Clear existing electives
             if data.get('electives'):
-                elective_names = [e.strip() for e in data['electives'].split(',') if e.strip()]
-                for elective_name in elective_names:
-                    if g.app_mode == 'school':
-                        # Find elective subject
-                        elective = db.session.query(Subject).filter_by(
-                            name=elective_name.strip(), 
-                            is_elective=True
-                        ).first()
-                    else:  # college
-                        # Find elective course
-                        elective = db.session.query(Course).filter_by(
-                            name=elective_name.strip(),
-                            course_type='elective'
-                        ).first()
-                    
-                    if elective:
-                        new_student.electives.append(elective)
+                student.electives.extend(find_electives(data['electives']))
             
-            message = "Student created successfully."
-            log_activity('info', f"Student '{data['full_name']}' created.")
-
-        else: # PUT or DELETE
-            student = Student.query.get_or_404(student_id)
-            user = student.user
-
-            if request.method == 'PUT':
-                if user.username != data['username'] and User.query.filter_by(username=data['username']).first(): return jsonify({"message": "Username already exists."}), 409
-                if data.get('email') and user.email != data['email'] and User.query.filter_by(email=data['email']).first(): return jsonify({"message": "Email already exists."}), 409
-                
-                user.username, user.email = data['username'], data.get('email')
-                if data.get('password'): user.password = hash_password(data['password'])
-                
-                student.full_name, student.section_id = data['full_name'], data['section_id']
-                
-                # Handle electives update
-                student.electives.clear()  # Clear existing electives
-                if data.get('electives'):
-                    elective_names = [e.strip() for e in data['electives'].split(',') if e.strip()]
-                    for elective_name in elective_names:
-                        if g.app_mode == 'school':
-                            # Find elective subject
-                            elective = db.session.query(Subject).filter_by(
-                                name=elective_name.strip(), 
-                                is_elective=True
-                            ).first()
-                        else:  # college
-                            # Find elective course
-                            elective = db.session.query(Course).filter_by(
-                                name=elective_name.strip(),
-                                course_type='elective'
-                            ).first()
-                        
-                        if elective:
-                            student.electives.append(elective)
-                
-                message = "Student updated successfully."
-                log_activity('info', f"Student '{student.full_name}' updated.")
-
-            elif request.method == 'DELETE':
-                db.session.delete(user) # Deleting user cascades to student
-                message = "Student deleted successfully."
-                log_activity('warning', f"Student '{student.full_name}' deleted.")
-
-        db.session.commit()
-        return jsonify({"message": message})
-        
-    except exc.IntegrityError:
-        db.session.rollback()
-        return jsonify({"message": "Database integrity error. Check for duplicate data."}), 400
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"message": f"An unexpected error occurred: {e}"}), 500
+            db.session.flush()
+            message = "Student updated successfully."
+            activity = ('info', f"Student '{student.full_name}' updated.")
+
+        elif request.method == 'DELETE':
+            db.session.delete(user) # Deleting user cascades to student
+            message = "Student deleted successfully."
+            activity = ('warning', f"Student '{student.full_name}' deleted.")
+
+    db.session.commit()
+    invalidate_dashboard_cache()
+    log_activity(*activity)
+    if request.method in ('PUT', 'DELETE'):
+        return "", 204
+    return jsonify({"message": message})
 
 @sections_bp.route('/api/students/bulk_upload', methods=['POST'])
 def bulk_upload_students():
@@ -256,16 +260,42 @@ def bulk_upload_students():
 
     if file and file.filename.endswith('.csv'):
         try:
-            if g.app_mode == 'school': sections_query = StudentSection.query.filter_by(grade_id=parent_id).all()
-            else: sections_query = StudentSection.query.filter_by(department_id=parent_id).all()
-            sections_map = {s.name.lower(): s.id for s in sections_query}
-
-            stream = io.StringIO(file.stream.read().decode("UTF8"), newline=None)
+            # Decode and parse the upload line by line instead of reading it whole
+            stream = io.TextIOWrapper(file.stream, encoding='utf-8', newline='')
             csv_reader = csv.reader(stream)
             next(csv_reader, None) # Skip header
 
             imported_count, failed_count = 0, 0
             
+            # Uniqueness is checked against sets read once up front and kept
+            # current as rows are accepted; all new rows are written at the end.
+            existing_usernames, existing_emails = set(), set()
+            for username, email in db.session.query(User.username, User.email):
+                existing_usernames.add(username)
+                if email:
+                    existing_emails.add(email)
+            enrolled = set()
+            if g.app_mode == 'college':
+                enrolled = set(db.session.query(User.username, Semester.name, Department.name)
+                               .join(Student, Student.user_id == User.id).join(StudentSection, StudentSection.id == Student.section_id)
+                               .join(Department, Department.id == StudentSection.department_id).join(Semester, Semester.id == Department.semester_id))
+
+            # Sections, their student counts, semesters and departments are
+            # also loaded once and resolved in memory for every row.
+            sections, section_grades = {}, {}
+            for section in StudentSection.query.order_by(StudentSection.id):
+                sections.setdefault((section.name, section.grade_id if g.app_mode == 'school' else section.department_id), section)
+                section_grades.setdefault(section.name, section.grade_id)
+            occupancy = defaultdict(int, db.session.query(Student.section_id, func.count(Student.id)).group_by(Student.section_id))
+            name_counts = {}
+            semester_ids, department_ids = {}, {}
+            if g.app_mode == 'college':
+                for semester_id, name in db.session.query(Semester.id, Semester.name).order_by(Semester.id):
+                    semester_ids.setdefault(name, semester_id)
+                for department_id, semester_id, name in db.session.query(Department.id, Department.semester_id, Department.name).order_by(Department.id):
+                    department_ids.setdefault((semester_id, name), department_id)
+            new_users, new_students = [], []
+            
             for row_num, row in enumerate(csv_reader, start=2):  # Start at 2 because we skipped header
                 try:
                     if g.app_mode == 'school':
@@ -284,6 +314,7 @@ def bulk_upload_students():
 
                     if not full_name:
                         raise ValueError("Full Name is required")
+                    username = full_name.translate(WHITESPACE_TABLE).lower()
                     
                     # For college mode, validate semester and department uniqueness
                     if g.app_mode == 'college':
@@ -291,61 +322,69 @@ def bulk_upload_students():
                             raise ValueError("Semester and Department are required for college mode")
                         
                         # Check if student already exists with this semester-department combination
-                        existing_student = db.session.query(Student).join(User).join(StudentSection).join(Department).join(Semester).filter(
-                            User.username == "".join(full_name.lower().split()),
-                            Semester.name == semester_name,
-                            Department.name == department_name
-                        ).first()
-                        
-                        if existing_student:
+                        if (username, semester_name, department_name) in enrolled:
                             raise ValueError(f"Student already exists with semester '{semester_name}' and department '{department_name}'")
                     
                     # Seamlessly find or create section - the best in the world!
                     if g.app_mode == 'school':
                         # For school, find any existing section to get grade_id
-                        section = StudentSection.query.filter_by(name=section_name).first()
-                        if section:
-                            target_section = find_or_create_section(section_name, grade_id=section.grade_id)
+                        if section_name in section_grades:
+                            target_section = find_or_create_section(section_name, sections, occupancy, name_counts, grade_id=section_grades[section_name])
                         else:
                             # No sections exist yet, create with default grade_id
-                            target_section = find_or_create_section(section_name, grade_id=1)  # Default to first grade
+                            target_section = find_or_create_section(section_name, sections, occupancy, name_counts, grade_id=1)  # Default to first grade
                     else:  # college
                         # For college, find department based on semester and department name
-                        semester = Semester.query.filter_by(name=semester_name).first()
-                        if not semester:
+                        semester_id = semester_ids.get(semester_name)
+                        if semester_id is None:
                             raise ValueError(f"Semester '{semester_name}' not found")
                         
-                        department = Department.query.filter_by(
-                            semester_id=semester.id,
-                            name=department_name
-                        ).first()
+                        department_id = department_ids.get((semester_id, department_name))
                         
-                        if not department:
+                        if department_id is None:
                             raise ValueError(f"Department '{department_name}' not found for semester '{semester_name}'")
                         
                         # Seamlessly create or find section
-                        target_section = find_or_create_section(section_name, department_id=department.id)
+                        target_section = find_or_create_section(section_name, sections, occupancy, name_counts, department_id=department_id)
+                    section_grades.setdefault(target_section.name, target_section.grade_id)
 
-                    username = "".join(full_name.lower().split())
-                    if User.query.filter_by(username=username).first(): 
-                        username = f"{username}{random.randint(10, 99)}"
-                    if email and User.query.filter_by(email=email).first(): 
+                    enrolled_key = (username, semester_name, department_name)
+                    if email and email in existing_emails: 
                         raise ValueError(f"Email '{email}' already exists")
+                    # Taken usernames get the first free numeric suffix
+                    base_username, suffix = username, 0
+                    while username in existing_usernames:
+                        suffix += 1
+                        username = f"{base_username}{suffix}"
                     
-                    with db.session.begin_nested():
-                        new_user = User(username=username, email=email, password=hash_password(username), role='student')
-                        db.session.add(new_user); db.session.flush()
-                        new_student = Student(full_name=full_name, section_id=target_section.id, user_id=new_user.id)
-                        db.session.add(new_student)
-                        db.session.flush()
+                    new_users.append({'username': username, 'email': email, 'password': hash_password(username), 'role': 'student'})
+                    new_students.append({'full_name': full_name, 'section_id': target_section.id, 'username': username})
+                    existing_usernames.add(username)
+                    if email:
+                        existing_emails.add(email)
+                    enrolled.add(enrolled_key)
+                    occupancy[target_section.id] += 1
                     imported_count += 1
                 except Exception as e:
                     failed_count += 1
-                    print(f"Row {row_num} failed: {str(e)}")  # Debug logging
-                    print(f"Row data: {row}")  # Debug the actual row data
+                    logger.debug("Row %s failed: %s", row_num, e)
+                    logger.debug("Row data: %s", row)
                     continue
 
+            if new_users:
+                # Usernames are unique, so the new ids are read back by username;
+                # this works on MySQL too, which has no INSERT ... RETURNING.
+                db.session.execute(User.__table__.insert(), new_users)
+                usernames = [row['username'] for row in new_users]
+                user_ids = {}
+                for start in range(0, len(usernames), BULK_LOOKUP_BATCH_SIZE):
+                    user_ids.update(db.session.query(User.username, User.id).filter(User.username.in_(usernames[start:start + BULK_LOOKUP_BATCH_SIZE])))
+                db.session.execute(Student.__table__.insert(), [
+                    {'full_name': row['full_name'], 'section_id': row['section_id'], 'user_id': user_ids[row['username']]}
+                    for row in new_students
+                ])
             db.session.commit()
+            invalidate_dashboard_cache()
             log_activity('info', f"Bulk imported {imported_count} students. {failed_count} rows failed.")
             return jsonify({"message": f"Successfully imported {imported_count} students. Failed rows: {failed_count}."})
         except Exception as e:
@@ -359,12 +398,22 @@ def download_csv_template():
     if 'user_id' not in session:
         return redirect(url_for('main.login'))
     
+    return send_file(
+        io.BytesIO(build_csv_template(g.app_mode)),
+        mimetype='text/csv',
+        as_attachment=True,
+        download_name='student_import_template.csv'
+    )
+
+@cache.memoize(timeout=3600)
+def build_csv_template(app_mode):
+    """Encoded CSV template; only the college semester/department names come from the database."""
     # Create CSV template
     output = io.StringIO()
     writer = csv.writer(output)
     
     # Write header based on app mode
-    if g.app_mode == 'school':
+    if app_mode == 'school':
         writer.writerow(['Full Name', 'Section Name', 'Email (Optional)'])
     else:  # college
         writer.writerow(['Full Name', 'Section Name', 'Semester', 'Department', 'Email (Optional)'])
@@ -390,36 +439,14 @@ def download_csv_template():
         'andrew.hernandez@example.com', 'dorothy.king@example.com', 'joshua.wright@example.com', 'helen.lopez@example.com', 'kenneth.hill@example.com'
     ]
     
-    # Get actual sections for sample data
     try:
-        if g.app_mode == 'school':
-            # Get sections from the first grade
-            first_grade = db.session.query(StudentSection.grade_id).filter(StudentSection.grade_id.isnot(None)).first()
-            if first_grade:
-                sections = StudentSection.query.filter_by(grade_id=first_grade[0]).all()
-                # Get electives from streams
-                electives = db.session.query(Subject).filter_by(is_elective=True).limit(5).all()
-            else:
-                sections = []
-                electives = []
-        else:  # college
-            # Get sections from the first department
-            first_dept = db.session.query(StudentSection.department_id).filter(StudentSection.department_id.isnot(None)).first()
-            if first_dept:
-                sections = StudentSection.query.filter_by(department_id=first_dept[0]).all()
-                # Get electives from courses
-                electives = db.session.query(Course).filter_by(course_type='elective').limit(5).all()
-            else:
-                sections = []
-                electives = []
-        
         # Always use multiple sections for CSV template to distribute students
         # Get semesters and departments for college mode
         semesters = []
         departments = []
-        if g.app_mode == 'college':
-            semesters = db.session.query(Semester).all()
-            departments = db.session.query(Department).all()
+        if app_mode == 'college':
+            semesters = [name for (name,) in db.session.query(Semester.name).order_by(Semester.id)]
+            departments = [name for (name,) in db.session.query(Department.name).order_by(Department.id)]
         
         # Use multiple sections to distribute students
         template_sections = ['Section A', 'Section B', 'Section C', 'Section D', 'Section E']
@@ -429,14 +456,14 @@ def download_csv_template():
             email = sample_emails[i] if i < len(sample_emails) else f'student{i+1}@example.com'
             section = template_sections[i % len(template_sections)]  # Cycle through template sections
             
-            if g.app_mode == 'school':
+            if app_mode == 'school':
                 writer.writerow([name, section, email])
             else:  # college
                 # Use actual semester and department from database
                 if semesters and departments:
                     semester = semesters[i % len(semesters)]
                     department = departments[i % len(departments)]
-                    writer.writerow([name, section, semester.name, department.name, email])
+                    writer.writerow([name, section, semester, department, email])
                 else:
                     # Fallback if no semesters/departments found
                     writer.writerow([name, section, "SEM 1", "Electronics", email])
@@ -452,22 +479,11 @@ def download_csv_template():
             email = sample_emails[i] if i < len(sample_emails) else f'student{i+1}@example.com'
             section = fallback_sections[i % len(fallback_sections)]
             
-            if g.app_mode == 'school':
+            if app_mode == 'school':
                 writer.writerow([name, section, email])
             else:  # college
                 semester = fallback_semesters[i % len(fallback_semesters)]
                 department = fallback_departments[i % len(fallback_departments)]
                 writer.writerow([name, section, semester, department, email])
     
-    # Prepare file for download
-    output.seek(0)
-    mem = io.BytesIO()
-    mem.write(output.getvalue().encode('utf-8'))
-    mem.seek(0)
-    
-    return send_file(
-        mem,
-        mimetype='text/csv',
-        as_attachment=True,
-        download_name='student_import_template.csv'
-    )
+    return output.getvalue().encode('utf-8')
@@ -1,9 +1,10 @@
+from collections import defaultdict
+
 from flask import Blueprint, jsonify, request, session, redirect, url_for, render_template, g
-from sqlalchemy import exc
 
-from extensions import db
-from models import User, Teacher, Subject, Course
-from utils import hash_password, log_activity, validate_json_request
+from extensions import db, cache
+from models import User, Teacher, Subject, Course, teacher_school_subjects_association, teacher_college_courses_association
+from utils import hash_password, log_activity, validate_json_request, rollback_on_error, invalidate_dashboard_cache, invalidate_timetable_export, USER_CONFLICTS
 
 staff_bp = Blueprint('staff', __name__, url_prefix='/staff')
 
@@ -13,113 +14,117 @@ def manage_staff():
         return redirect(url_for('main.login'))
     return render_template('staff.html')
 
+@cache.memoize(timeout=60)
+def load_teachable_items(app_mode):
+    """List every subject (school) or course (college) a teacher can be assigned, sorted by name."""
+    if app_mode == 'school':
+        rows = db.session.query(Subject.id, Subject.name, Subject.code).order_by(Subject.name)
+        item_type = "subject"
+    else:
+        rows = db.session.query(Course.id, Course.name, Course.code).order_by(Course.name)
+        item_type = "course"
+    return [{"id": item_id, "name": name, "code": code, "type": item_type} for item_id, name, code in rows]
+
+def load_teacher_list():
+    """Build the staff listing: one join for teacher/user columns, one per assignment table."""
+    teachable = defaultdict(list)
+    subject_rows = db.session.query(teacher_school_subjects_association.c.teacher_id, Subject.id, Subject.name) \
+        .join(Subject, Subject.id == teacher_school_subjects_association.c.subject_id)
+    course_rows = db.session.query(teacher_college_courses_association.c.teacher_id, Course.id, Course.name) \
+        .join(Course, Course.id == teacher_college_courses_association.c.course_id)
+    for rows in (subject_rows, course_rows):
+        for teacher_id, item_id, name in rows:
+            teachable[teacher_id].append({"id": item_id, "name": name})
+
+    teachers = db.session.query(Teacher.id, Teacher.full_name, User.email, User.username, Teacher.max_weekly_hours) \
+        .join(User, User.id == Teacher.user_id)
+    return [{
+        "id": teacher_id,
+        "full_name": full_name,
+        "email": email,
+        "username": username,
+        "max_weekly_hours": max_weekly_hours,
+        "subjects": teachable[teacher_id]
+    } for teacher_id, full_name, email, username, max_weekly_hours in teachers]
+
+def assign_teachables(teacher_id, app_mode, item_ids, replace=False):
+    """Write a teacher's subject/course links with bulk Core statements."""
+    if replace:
+        for table in (teacher_school_subjects_association, teacher_college_courses_association):
+            db.session.execute(table.delete().where(table.c.teacher_id == teacher_id))
+    if app_mode == 'school':
+        table, model, column = teacher_school_subjects_association, Subject, 'subject_id'
+    else:
+        table, model, column = teacher_college_courses_association, Course, 'course_id'
+    item_ids = set(item_ids or [])
+    if not item_ids:
+        return
+    valid_ids = [item_id for (item_id,) in db.session.query(model.id).filter(model.id.in_(item_ids))]
+    if valid_ids:
+        db.session.execute(table.insert(), [{"teacher_id": teacher_id, column: item_id} for item_id in valid_ids])
+
 @staff_bp.route('/api/all_subjects', methods=['GET'])
 def get_all_subjects_for_staff():
     if 'user_id' not in session:
         return jsonify({"message": "Unauthorized"}), 401
-    
-    subjects_list = []
-    if g.app_mode == 'school':
-        subjects = Subject.query.order_by(Subject.name).all()
-        subjects_list = [{"id": s.id, "name": s.name, "code": s.code, "type": "subject"} for s in subjects]
-    else:
-        courses = Course.query.order_by(Course.name).all()
-        subjects_list = [{"id": c.id, "name": c.name, "code": c.code, "type": "course"} for c in courses]
-        
-    return jsonify({"subjects": subjects_list})
+    return jsonify({"subjects": load_teachable_items(g.app_mode)})
 
 @staff_bp.route('/api', methods=['GET', 'POST'])
 @staff_bp.route('/api/<int:teacher_id>', methods=['PUT', 'DELETE'])
+@rollback_on_error("Database integrity error occurred.", conflicts=USER_CONFLICTS)
 def handle_staff(teacher_id=None):
     if 'user_id' not in session:
         return jsonify({"message": "Unauthorized"}), 401
 
-    try:
-        if request.method == 'GET':
-            teachers = Teacher.query.options(
-                db.joinedload(Teacher.user), 
-                db.joinedload(Teacher.subjects),
-                db.joinedload(Teacher.courses)
-            ).all()
-            
-            teacher_list = []
-            for t in teachers:
-                subjects = [{"id": s.id, "name": s.name} for s in t.subjects]
-                courses = [{"id": c.id, "name": c.name} for c in t.courses]
-                all_teachable = subjects + courses
-
-                teacher_list.append({
-                    "id": t.id,
-                    "full_name": t.full_name,
-                    "email": t.user.email,
-                    "username": t.user.username,
-                    "max_weekly_hours": t.max_weekly_hours,
-                    "subjects": all_teachable
-                })
-            return jsonify({"teachers": teacher_list})
-
-        data, error_response, status_code = validate_json_request()
-        if error_response:
-            return error_response, status_code
-        
-        if request.method == 'POST':
-            if not data.get('password'): return jsonify({"message": "Password is required for new teachers."}), 400
-            if User.query.filter_by(username=data['username']).first(): return jsonify({"message": "Username already exists."}), 409
-            if User.query.filter_by(email=data['email']).first(): return jsonify({"message": "Email already exists."}), 409
-
-            new_user = User(username=data['username'], email=data['email'], password=hash_password(data['password']), role='teacher')
-            db.session.add(new_user)
-            db.session.flush()
-
-            new_teacher = Teacher(full_name=data['full_name'], max_weekly_hours=data['max_weekly_hours'], user_id=new_user.id)
-            db.session.add(new_teacher)
-            db.session.flush()
-
-            if g.app_mode == 'school':
-                new_teacher.subjects = Subject.query.filter(Subject.id.in_(data.get('subject_ids', []))).all()
-            else:
-                new_teacher.courses = Course.query.filter(Course.id.in_(data.get('subject_ids', []))).all()
-
-            db.session.commit()
-            log_activity('info', f"Teacher '{data['full_name']}' created.")
-            return jsonify({"message": "Teacher created successfully!"})
+    if request.method == 'GET':
+        return jsonify({"teachers": load_teacher_list()})
+
+    data, error_response, status_code = validate_json_request()
+    if error_response:
+        return error_response, status_code
+    
+    if request.method == 'POST':
+        if not data.get('password'): return jsonify({"message": "Password is required for new teachers."}), 400
+
+        new_user = User(username=data['username'], email=data['email'], password=hash_password(data['password']), role='teacher')
+        db.session.add(new_user)
+
+        new_teacher = Teacher(full_name=data['full_name'], max_weekly_hours=data['max_weekly_hours'], user=new_user)
+        db.session.add(new_teacher)
+        db.session.flush()
+
+        assign_teachables(new_teacher.id, g.app_mode, data.get('subject_ids', []))
+
+        db.session.commit()
+        invalidate_dashboard_cache()
+        log_activity('info', f"Teacher '{data['full_name']}' created.")
+        return jsonify({"message": "Teacher created successfully!"})
+    
+    teacher = db.get_or_404(Teacher, teacher_id)
+    
+    if request.method == 'PUT':
+        user = teacher.user
         
-        teacher = Teacher.query.get_or_404(teacher_id)
+        user.username = data['username']
+        user.email = data['email']
+        if data.get('password'): user.password = hash_password(data['password'])
         
-        if request.method == 'PUT':
-            user = teacher.user
-            if user.username != data['username'] and User.query.filter_by(username=data['username']).first(): return jsonify({"message": "Username already exists."}), 409
-            if user.email != data['email'] and User.query.filter_by(email=data['email']).first(): return jsonify({"message": "Email already exists."}), 409
-            
-            user.username = data['username']
-            user.email = data['email']
-            if data.get('password'): user.password = hash_password(data['password'])
-            
-            teacher.full_name = data['full_name']
-            teacher.max_weekly_hours = data['max_weekly_hours']
-
-            if g.app_mode == 'school':
-                teacher.subjects = Subject.query.filter(Subject.id.in_(data.get('subject_ids', []))).all()
-                teacher.courses = []
-            else:
-                teacher.courses = Course.query.filter(Course.id.in_(data.get('subject_ids', []))).all()
-                teacher.subjects = []
-
-            db.session.commit()
-            log_activity('info', f"Teacher '{teacher.full_name}' updated.")
-            return jsonify({"message": "Teacher updated successfully!"})
-
-        if request.method == 'DELETE':
-            user_to_delete = teacher.user
-            db.session.delete(teacher)
-            db.session.delete(user_to_delete)
-            db.session.commit()
-            log_activity('warning', f"Teacher '{teacher.full_name}' deleted.")
-            return jsonify({"message": "Teacher deleted successfully!"})
-
-    except exc.IntegrityError as e:
-        db.session.rollback()
-        return jsonify({"message": "Database integrity error occurred."}), 400
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"message": f"An unexpected error occurred: {e}"}), 500
+        teacher.full_name = data['full_name']
+        teacher.max_weekly_hours = data['max_weekly_hours']
+
+        assign_teachables(teacher.id, g.app_mode, data.get('subject_ids', []), replace=True)
+
+        db.session.commit()
+        invalidate_timetable_export()
+        log_activity('info', f"Teacher '{teacher.full_name}' updated.")
+        return jsonify({"message": "Teacher updated successfully!"})
+
+    if request.method == 'DELETE':
+        user_to_delete = teacher.user
+        db.session.delete(teacher)
+        db.session.delete(user_to_delete)
+        db.session.commit()
+        invalidate_dashboard_cache()
+        invalidate_timetable_export()
+        log_activity('warning', f"Teacher '{teacher.full_name}' deleted.")
+        return jsonify({"message": "Teacher deleted successfully!"})
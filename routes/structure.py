@@ -1,8 +1,12 @@
+from collections import defaultdict
+
 from flask import Blueprint, jsonify, request, session, redirect, url_for, render_template
 
-from extensions import db
-from models import SchoolGroup, Grade, Stream, Semester, Department
-from utils import log_activity, validate_json_request
+from extensions import db, cache
+from models import SchoolGroup, Grade, Stream, Semester, Department, StudentSection, Subject, Course
+from utils import log_activity, validate_json_request, invalidate_timetable_export
+from routes.subjects import load_parent_items
+from routes.sections import build_csv_template
 
 structure_bp = Blueprint('structure', __name__, url_prefix='/structure')
 
@@ -12,28 +16,79 @@ def manage_structure():
         return redirect(url_for('main.login'))
     return render_template('structure.html')
 
+@cache.memoize(timeout=60)
+def load_structure_items(mode):
+    """Build the structure listing for a mode from column-only queries."""
+    if mode == 'school':
+        grades, streams = defaultdict(list), defaultdict(list)
+        for grade_id, name, group_id in db.session.query(Grade.id, Grade.name, Grade.group_id):
+            grades[group_id].append({"id": grade_id, "name": name})
+        for stream_id, name, group_id in db.session.query(Stream.id, Stream.name, Stream.group_id):
+            streams[group_id].append({"id": stream_id, "name": name})
+        return [
+            {"id": group_id, "name": name, "grades": grades[group_id], "streams": streams[group_id]}
+            for group_id, name in db.session.query(SchoolGroup.id, SchoolGroup.name)
+        ]
+    if mode == 'college':
+        departments = defaultdict(list)
+        for dept_id, name, semester_id in db.session.query(Department.id, Department.name, Department.semester_id):
+            departments[semester_id].append({"id": dept_id, "name": name})
+        return [
+            {"id": sem_id, "name": name, "departments": departments[sem_id]}
+            for sem_id, name in db.session.query(Semester.id, Semester.name)
+        ]
+    return []
+
+def invalidate_structure_cache():
+    """Drop cached structure and parent listings after a structure change."""
+    cache.delete_memoized(load_structure_items)
+    cache.delete_memoized(load_parent_items)
+    cache.delete_memoized(build_csv_template)
+    invalidate_timetable_export()
+
+# Columns that point at a structure child and are cleared when it is removed,
+# matching what the ORM does on a per-object delete.
+STRUCTURE_DEPENDENTS = {
+    Grade: [StudentSection.grade_id],
+    Stream: [Subject.stream_id],
+    Department: [StudentSection.department_id, Course.department_id],
+}
+
+def delete_structure_children(model, ids):
+    """Delete grades, streams or departments by id in one statement."""
+    if not ids:
+        return
+    ids = list(ids)
+    for column in STRUCTURE_DEPENDENTS[model]:
+        db.session.query(column.class_).filter(column.in_(ids)).update({column: None}, synchronize_session=False)
+    db.session.query(model).filter(model.id.in_(ids)).delete(synchronize_session=False)
+
+def insert_structure_children(model, parent_column, parent_id, names):
+    """Insert new grades, streams or departments under one parent in a single executemany."""
+    if names:
+        db.session.execute(model.__table__.insert(), [{"name": name, parent_column.key: parent_id} for name in names])
+
+def sync_structure_children(model, parent_column, parent_id, items):
+    """Apply an edited child list (grades, streams or departments) to a parent with bulk statements."""
+    renames, creations = [], []
+    for item in items:
+        child_id = item.get('id')
+        if child_id and not (isinstance(child_id, str) and child_id.startswith('new-')):
+            renames.append({"id": int(child_id), "name": item['name']})
+        elif item.get('name'):
+            creations.append(item['name'])
+    existing_ids = {child_id for (child_id,) in db.session.query(model.id).filter(parent_column == parent_id)}
+    delete_structure_children(model, existing_ids - {r["id"] for r in renames})
+    renames = [r for r in renames if r["id"] in existing_ids]
+    if renames:
+        db.session.bulk_update_mappings(model, renames)
+    insert_structure_children(model, parent_column, parent_id, creations)
+
 @structure_bp.route('/api/<mode>', methods=['GET'])
 def get_structure_items(mode):
     if 'user_id' not in session:
         return jsonify({"message": "Unauthorized"}), 401
-    
-    items_data = []
-    if mode == 'school':
-        groups = SchoolGroup.query.options(db.joinedload(SchoolGroup.grades), db.joinedload(SchoolGroup.streams)).all()
-        for group in groups:
-            items_data.append({
-                "id": group.id, "name": group.name,
-                "grades": [{"id": g.id, "name": g.name} for g in group.grades],
-                "streams": [{"id": s.id, "name": s.name} for s in group.streams]
-            })
-    elif mode == 'college':
-        semesters = Semester.query.options(db.joinedload(Semester.departments)).all()
-        for sem in semesters:
-            items_data.append({
-                "id": sem.id, "name": sem.name,
-                "departments": [{"id": d.id, "name": d.name} for d in sem.departments]
-            })
-    return jsonify({"items": items_data})
+    return jsonify({"items": load_structure_items(mode)})
 
 @structure_bp.route('/api/school', methods=['POST'])
 @structure_bp.route('/api/school/<int:item_id>', methods=['PUT', 'DELETE'])
@@ -47,56 +102,38 @@ def handle_school_structure(item_id=None):
             return error_response, status_code
         new_group = SchoolGroup(name=data['name'])
         db.session.add(new_group)
-        db.session.flush() # Get the ID for relationships
         for grade in data.get('grades', []):
             if grade.get('name'):
-                db.session.add(Grade(name=grade['name'], group_id=new_group.id))
+                db.session.add(Grade(name=grade['name'], group=new_group))
         for stream in data.get('streams', []):
             if stream.get('name'):
-                db.session.add(Stream(name=stream['name'], group_id=new_group.id))
+                db.session.add(Stream(name=stream['name'], group=new_group))
         db.session.commit()
+        invalidate_structure_cache()
         log_activity('info', f"School group '{data['name']}' created.")
         return jsonify({"message": "Group created successfully!"})
 
-    group = SchoolGroup.query.get_or_404(item_id)
+    group = db.get_or_404(SchoolGroup, item_id)
     if request.method == 'PUT': # Update Existing
         data, error_response, status_code = validate_json_request()
         if error_response:
             return error_response, status_code
         group.name = data['name']
         
-        # Sync Grades
-        existing_grades = {g.id: g for g in group.grades}
-        updated_grade_ids = {int(g['id']) for g in data['grades'] if g.get('id') and not str(g['id']).startswith('new-')}
-        for gid_to_del in existing_grades.keys() - updated_grade_ids:
-            db.session.delete(existing_grades[gid_to_del])
-        for g_data in data['grades']:
-            gid = g_data.get('id')
-            if gid and not str(gid).startswith('new-'):
-                existing_grades[int(gid)].name = g_data['name']
-            elif g_data.get('name'):
-                db.session.add(Grade(name=g_data['name'], group_id=group.id))
-            
-        # Sync Streams
-        existing_streams = {s.id: s for s in group.streams}
-        updated_stream_ids = {int(s['id']) for s in data['streams'] if s.get('id') and not str(s['id']).startswith('new-')}
-        for sid_to_del in existing_streams.keys() - updated_stream_ids:
-            db.session.delete(existing_streams[sid_to_del])
-        for s_data in data['streams']:
-            sid = s_data.get('id')
-            if sid and not str(sid).startswith('new-'):
-                existing_streams[int(sid)].name = s_data['name']
-            elif s_data.get('name'):
-                db.session.add(Stream(name=s_data['name'], group_id=group.id))
+        sync_structure_children(Grade, Grade.group_id, group.id, data['grades'])
+        sync_structure_children(Stream, Stream.group_id, group.id, data['streams'])
 
         db.session.commit()
+        invalidate_structure_cache()
         log_activity('info', f"School group '{group.name}' updated.")
         return jsonify({"message": "Group updated successfully!"})
         
     if request.method == 'DELETE':
-        log_activity('warning', f"School group '{group.name}' deleted.")
+        group_name = group.name
         db.session.delete(group)
         db.session.commit()
+        invalidate_structure_cache()
+        log_activity('warning', f"School group '{group_name}' deleted.")
         return jsonify({"message": "Group deleted successfully!"})
     return jsonify({"message": "Method not allowed"}), 405
 
@@ -113,39 +150,33 @@ def handle_college_structure(item_id=None):
             return error_response, status_code
         new_sem = Semester(name=data['name'])
         db.session.add(new_sem)
-        db.session.flush()
         for dept in data.get('departments', []):
             if dept.get('name'):
-                db.session.add(Department(name=dept['name'], semester_id=new_sem.id))
+                db.session.add(Department(name=dept['name'], semester=new_sem))
         db.session.commit()
+        invalidate_structure_cache()
         log_activity('info', f"Semester '{data['name']}' created.")
         return jsonify({"message": "Semester created successfully!"})
 
-    semester = Semester.query.get_or_404(item_id)
+    semester = db.get_or_404(Semester, item_id)
     if request.method == 'PUT':
         data, error_response, status_code = validate_json_request()
         if error_response:
             return error_response, status_code
         semester.name = data['name']
         
-        existing_depts = {d.id: d for d in semester.departments}
-        updated_dept_ids = {int(d['id']) for d in data['departments'] if d.get('id') and not str(d['id']).startswith('new-')}
-        for did_to_del in existing_depts.keys() - updated_dept_ids:
-            db.session.delete(existing_depts[did_to_del])
-        for d_data in data['departments']:
-            did = d_data.get('id')
-            if did and not str(did).startswith('new-'):
-                existing_depts[int(did)].name = d_data['name']
-            elif d_data.get('name'):
-                db.session.add(Department(name=d_data['name'], semester_id=semester.id))
+        sync_structure_children(Department, Department.semester_id, semester.id, data['departments'])
             
         db.session.commit()
+        invalidate_structure_cache()
         log_activity('info', f"Semester '{semester.name}' updated.")
         return jsonify({"message": "Semester updated successfully!"})
 
     if request.method == 'DELETE':
-        log_activity('warning', f"Semester '{semester.name}' deleted.")
+        semester_name = semester.name
         db.session.delete(semester)
         db.session.commit()
+        invalidate_structure_cache()
+        log_activity('warning', f"Semester '{semester_name}' deleted.")
         return jsonify({"message": "Semester deleted successfully!"})
     return jsonify({"message": "Method not allowed"}), 405
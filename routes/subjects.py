@@ -1,41 +1,87 @@
-from flask import Blueprint, jsonify, request, session, redirect, url_for, render_template
-from sqlalchemy import exc
+from collections import defaultdict
 
-from extensions import db
-from models import SchoolGroup, Semester, Subject, Course
-from utils import log_activity, validate_json_request
+from flask import Blueprint, jsonify, request, session, redirect, url_for, render_template, g
+from sqlalchemy import func
+
+from extensions import db, cache
+from models import SchoolGroup, Stream, Semester, Department, Subject, Course
+from utils import log_activity, validate_json_request, rollback_on_error, invalidate_dashboard_cache, invalidate_timetable_export
+from routes.staff import load_teachable_items
 
 subjects_bp = Blueprint('subjects', __name__, url_prefix='/subjects')
 
+# Duplicate-code messages for the items of each app mode
+CODE_CONFLICTS = {
+    'school': {"code": "Subject code '{code}' already exists."},
+    'college': {"code": "Course code '{code}' already exists."},
+}
+
 @subjects_bp.route('/')
 def manage_subjects():
     if 'user_id' not in session:
         return redirect(url_for('main.login'))
     return render_template('subjects.html')
 
+@cache.memoize(timeout=60)
+def load_parent_items(mode):
+    """Build the subject-parent listing (groups/streams or semesters/departments) from column-only queries."""
+    if mode == 'school':
+        parent_model, child_query = SchoolGroup, db.session.query(Stream.id, Stream.name, Stream.group_id)
+    elif mode == 'college':
+        parent_model, child_query = Semester, db.session.query(Department.id, Department.name, Department.semester_id)
+    else:
+        return []
+    children = defaultdict(list)
+    for child_id, name, parent_id in child_query:
+        children[parent_id].append({"id": child_id, "name": name})
+    return [
+        {"id": parent_id, "name": name, "children": children[parent_id]}
+        for parent_id, name in db.session.query(parent_model.id, parent_model.name)
+    ]
+
+@cache.memoize(timeout=60)
+def count_subject_items(mode):
+    """Count the subjects (school) or courses (college) shown on the dashboard."""
+    model = Subject if mode == 'school' else Course
+    return db.session.query(func.count(model.id)).scalar()
+
+@cache.memoize(timeout=60)
+def load_elective_items():
+    """List the elective subjects as plain dicts."""
+    return [
+        {'id': subject_id, 'name': name, 'code': code}
+        for subject_id, name, code in db.session.query(Subject.id, Subject.name, Subject.code).filter_by(is_elective=True)
+    ]
+
+def invalidate_subject_cache():
+    """Drop cached data derived from the subject/course catalog after a write."""
+    cache.delete_memoized(load_teachable_items)
+    cache.delete_memoized(count_subject_items)
+    cache.delete_memoized(load_elective_items)
+    invalidate_dashboard_cache()
+    invalidate_timetable_export()
+
+def load_subject_items(mode, parent_id):
+    """List the subjects of a stream or the courses of a department as plain dicts."""
+    if mode == 'school':
+        rows = db.session.query(Subject.id, Subject.name, Subject.code, Subject.weekly_hours, Subject.is_elective, Subject.stream_id).filter(Subject.stream_id == parent_id)
+        return [
+            {"id": subject_id, "name": name, "code": code, "weekly_hours": weekly_hours, "is_elective": is_elective, "stream_id": stream_id}
+            for subject_id, name, code, weekly_hours, is_elective, stream_id in rows
+        ]
+    if mode == 'college':
+        rows = db.session.query(Course.id, Course.name, Course.code, Course.credits, Course.course_type, Course.department_id).filter(Course.department_id == parent_id)
+        return [
+            {"id": course_id, "name": name, "code": code, "credits": credits, "course_type": course_type, "department_id": department_id}
+            for course_id, name, code, credits, course_type, department_id in rows
+        ]
+    return []
+
 @subjects_bp.route('/api/parents/<mode>', methods=['GET'])
 def get_parent_data(mode):
     if 'user_id' not in session:
         return jsonify({"message": "Unauthorized"}), 401
-    
-    parents = []
-    if mode == 'school':
-        groups = SchoolGroup.query.options(db.joinedload(SchoolGroup.streams)).all()
-        for group in groups:
-            parents.append({
-                "id": group.id,
-                "name": group.name,
-                "children": [{"id": s.id, "name": s.name} for s in group.streams]
-            })
-    elif mode == 'college':
-        semesters = Semester.query.options(db.joinedload(Semester.departments)).all()
-        for sem in semesters:
-            parents.append({
-                "id": sem.id,
-                "name": sem.name,
-                "children": [{"id": d.id, "name": d.name} for d in sem.departments]
-            })
-    return jsonify({"parents": parents})
+    return jsonify({"parents": load_parent_items(mode)})
 
 @subjects_bp.route('/api/<mode>', methods=['GET'])
 def get_subjects_data(mode):
@@ -44,22 +90,11 @@ def get_subjects_data(mode):
     parent_id = request.args.get('parent_id', type=int)
     if not parent_id:
         return jsonify({"items": []})
-    
-    response = {"items": []}
-    if mode == 'school':
-        subjects = Subject.query.filter_by(stream_id=parent_id).all()
-        response['items'] = [
-            {"id": s.id, "name": s.name, "code": s.code, "weekly_hours": s.weekly_hours, "is_elective": s.is_elective, "stream_id": s.stream_id} for s in subjects
-        ]
-    elif mode == 'college':
-        courses = Course.query.filter_by(department_id=parent_id).all()
-        response['items'] = [
-            {"id": c.id, "name": c.name, "code": c.code, "credits": c.credits, "course_type": c.course_type, "department_id": c.department_id} for c in courses
-        ]
-    return jsonify(response)
+    return jsonify({"items": load_subject_items(mode, parent_id)})
 
 @subjects_bp.route('/api/<mode>', methods=['POST'])
 @subjects_bp.route('/api/<mode>/<int:item_id>', methods=['PUT', 'DELETE'])
+@rollback_on_error("Database integrity error. Check for duplicate codes or invalid IDs.", conflicts=lambda: CODE_CONFLICTS[g.app_mode])
 def handle_subjects(mode, item_id=None):
     if 'user_id' not in session:
         return jsonify({"message": "Unauthorized"}), 401
@@ -71,59 +106,47 @@ def handle_subjects(mode, item_id=None):
     else:
         data = None
 
-    try:
-        if request.method == 'POST':
-            code = data.get('code')
-            if not code: return jsonify({"message": "Code is a required field."}), 400
+    if request.method == 'POST':
+        code = data.get('code')
+        if not code: return jsonify({"message": "Code is a required field."}), 400
+
+        if mode == 'school':
+            new_item = Subject(name=data['name'], code=code, weekly_hours=data['weekly_hours'], is_elective=data.get('is_elective', False), stream_id=data['stream_id'])
+            db.session.add(new_item)
+        else: # college
+            new_item = Course(name=data['name'], code=code, credits=data['credits'], course_type=data['course_type'], department_id=data['department_id'])
+            db.session.add(new_item)
+        
+        db.session.flush()
+        activity = ('info', f"{'Subject' if mode == 'school' else 'Course'} '{data['name']}' created.")
+        message = f"{'Subject' if mode == 'school' else 'Course'} created successfully!"
+
+    else: # PUT or DELETE
+        item = db.get_or_404(Subject, item_id) if mode == 'school' else db.get_or_404(Course, item_id)
 
+        if request.method == 'PUT':
+            new_code = data.get('code')
+            if not new_code: return jsonify({"message": "Code is a required field."}), 400
+            
+            item.name = data['name']
+            item.code = new_code
             if mode == 'school':
-                if Subject.query.filter_by(code=code).first():
-                    return jsonify({"message": f"Subject code '{code}' already exists."}), 409
-                new_item = Subject(name=data['name'], code=code, weekly_hours=data['weekly_hours'], is_elective=data.get('is_elective', False), stream_id=data['stream_id'])
-                db.session.add(new_item)
+                item.weekly_hours = data['weekly_hours']
+                item.is_elective = data.get('is_elective', False)
             else: # college
-                if Course.query.filter_by(code=code).first():
-                    return jsonify({"message": f"Course code '{code}' already exists."}), 409
-                new_item = Course(name=data['name'], code=code, credits=data['credits'], course_type=data['course_type'], department_id=data['department_id'])
-                db.session.add(new_item)
+                item.credits = data['credits']
+                item.course_type = data['course_type']
             
-            log_activity('info', f"{'Subject' if mode == 'school' else 'Course'} '{data['name']}' created.")
-            message = f"{'Subject' if mode == 'school' else 'Course'} created successfully!"
-
-        else: # PUT or DELETE
-            item = Subject.query.get_or_404(item_id) if mode == 'school' else Course.query.get_or_404(item_id)
-
-            if request.method == 'PUT':
-                new_code = data.get('code')
-                if not new_code: return jsonify({"message": "Code is a required field."}), 400
-                if item.code != new_code:
-                    if (mode == 'school' and Subject.query.filter_by(code=new_code).first()) or \
-                       (mode == 'college' and Course.query.filter_by(code=new_code).first()):
-                        return jsonify({"message": f"{'Subject' if mode == 'school' else 'Course'} code '{new_code}' already exists."}), 409
-                
-                item.name = data['name']
-                item.code = new_code
-                if mode == 'school':
-                    item.weekly_hours = data['weekly_hours']
-                    item.is_elective = data.get('is_elective', False)
-                else: # college
-                    item.credits = data['credits']
-                    item.course_type = data['course_type']
-                
-                log_activity('info', f"{'Subject' if mode == 'school' else 'Course'} '{item.name}' updated.")
-                message = f"{'Subject' if mode == 'school' else 'Course'} updated successfully!"
-
-            elif request.method == 'DELETE':
-                db.session.delete(item)
-                log_activity('warning', f"{'Subject' if mode == 'school' else 'Course'} '{item.name}' deleted.")
-                message = f"{'Subject' if mode == 'school' else 'Course'} deleted successfully!"
-
-        db.session.commit()
-        return jsonify({"message": message})
-
-    except exc.IntegrityError:
-        db.session.rollback()
-        return jsonify({"message": "Database integrity error. Check for duplicate codes or invalid IDs."}), 400
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({"message": f"An unexpected error occurred: {e}"}), 500
+            db.session.flush()
+            activity = ('info', f"{'Subject' if mode == 'school' else 'Course'} '{item.name}' updated.")
+            message = f"{'Subject' if mode == 'school' else 'Course'} updated successfully!"
+
+        elif request.method == 'DELETE':
+            db.session.delete(item)
+            activity = ('warning', f"{'Subject' if mode == 'school' else 'Course'} '{item.name}' deleted.")
+            message = f"{'Subject' if mode == 'school' else 'Course'} deleted successfully!"
+
+    db.session.commit()
+    invalidate_subject_cache()
+    log_activity(*activity)
+    return jsonify({"message": message})
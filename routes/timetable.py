@@ -1,12 +1,17 @@
+import csv
+import io
 import time
 import random
 import json
 import os
+import traceback
 import requests
 from flask import Blueprint, request, redirect, url_for, session, g, jsonify, render_template, make_response
 from sqlalchemy.orm import joinedload
+from extensions import cache
 from models import db, Teacher, Student, StudentSection, Classroom, Subject, Course, AppConfig, TimetableEntry, SchoolGroup, Grade, Stream, Semester, Department
-from utils import set_config, log_activity, validate_json_request
+from utils import set_config, log_activity, validate_json_request, invalidate_dashboard_cache, invalidate_timetable_export, EXPORT_CACHE_KEY, EXPORT_CACHE_TIMEOUT
+from advanced_timetable_generator import TimetableGenerator
 
 timetable_bp = Blueprint('timetable', __name__)
 
@@ -111,6 +116,8 @@ def generate_timetable():
         # Clear existing timetable entries
         TimetableEntry.query.delete()
         db.session.commit()
+        invalidate_timetable_export()
+        invalidate_dashboard_cache()
         print("🗑️ Cleared existing timetable entries")
 
         # Get all sections with students
@@ -151,9 +158,7 @@ def generate_timetable():
             'breaks': json.loads(AppConfig.query.filter_by(key='breaks').first().value)
         }
 
-        # Import and use the advanced timetable generator
-        from advanced_timetable_generator import TimetableGenerator
-
+        # Use the advanced timetable generator
         generator = TimetableGenerator(
             sections=sections_with_students,
             teachers=teachers,
@@ -174,7 +179,6 @@ def generate_timetable():
             print(f"✅ DEBUG: Algorithm generated {len(algorithm_entries)} entries")
         except Exception as algo_error:
             print(f"❌ DEBUG: Algorithm error: {algo_error}")
-            import traceback
             traceback.print_exc()
             raise algo_error
 
@@ -229,26 +233,26 @@ def generate_timetable():
                 assigned_resources['times'][section_id] = set()
 
             # Validate IDs exist in database
-            if not Teacher.query.get(teacher_id):
+            if not db.session.get(Teacher, teacher_id):
                 print(f"⚠️ Teacher {teacher_id} not found, skipping")
                 continue
-            if not Classroom.query.get(classroom_id):
+            if not db.session.get(Classroom, classroom_id):
                 print(f"⚠️ Classroom {classroom_id} not found, skipping")
                 continue
-            if not StudentSection.query.get(entry_data['section_id']):
+            if not db.session.get(StudentSection, entry_data['section_id']):
                 print(f"⚠️ Section {entry_data['section_id']} not found, skipping")
                 continue
 
             # Validate course_id exists (for college mode)
             if g.app_mode == 'college' and 'course_id' in entry_data and entry_data['course_id']:
-                if not Course.query.get(entry_data['course_id']):
+                if not db.session.get(Course, entry_data['course_id']):
                     print(f"⚠️ Course {entry_data['course_id']} not found, skipping")
                     continue
 
             # Validate subject_id exists (for school mode)
             if g.app_mode == "school":
                 if 'subject_id' in entry_data and entry_data['subject_id']:
-                    if not Subject.query.get(entry_data['subject_id']):
+                    if not db.session.get(Subject, entry_data['subject_id']):
                         print(f"⚠️ Subject {entry_data['subject_id']} not found, skipping")
                         continue
 
@@ -272,7 +276,6 @@ def generate_timetable():
                 print(f"✅ DEBUG: Successfully added entry {i+1}")
             except Exception as db_error:
                 print(f"❌ DEBUG: Database error adding entry {i+1}: {db_error}")
-                import traceback
                 traceback.print_exc()
                 raise db_error
 
@@ -330,10 +333,11 @@ def generate_timetable():
             print(f"✅ DEBUG: Database commit successful")
         except Exception as commit_error:
             print(f"❌ DEBUG: Database commit error: {commit_error}")
-            import traceback
             traceback.print_exc()
             raise commit_error
 
+        invalidate_timetable_export()
+        invalidate_dashboard_cache()
         print(f"🎉 Successfully generated timetable with {total_saved} entries")
         log_activity('info', f'Successfully generated timetable with {total_saved} entries')
         
@@ -358,6 +362,8 @@ def clear_timetable():
     try:
         TimetableEntry.query.delete()
         db.session.commit()
+        invalidate_timetable_export()
+        invalidate_dashboard_cache()
         log_activity('info', 'Timetable cleared')
         return jsonify({'message': 'Timetable cleared successfully'})
 
@@ -373,59 +379,13 @@ def export_timetable():
         return jsonify({'error': 'Unauthorized'}), 401
 
     try:
-        import csv
-        import io
-
-        # Get all timetable entries
-        entries = TimetableEntry.query.options(
-            joinedload(TimetableEntry.teacher),
-            joinedload(TimetableEntry.section),
-            joinedload(TimetableEntry.classroom),
-            joinedload(TimetableEntry.subject),
-            joinedload(TimetableEntry.course)
-        ).all()
-
-        # Create CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-
-        # Write header
-        writer.writerow([
-            'Day', 'Period', 'Teacher', 'Section', 'Classroom', 
-            'Subject/Course', 'Semester', 'Department'
-        ])
-
-        # Write data
-        for entry in entries:
-            # Get semester and department info
-            semester_name = "Unknown"
-            department_name = "Unknown"
-
-            if hasattr(entry.section, 'department') and entry.section.department:
-                department_name = entry.section.department.name
-                if hasattr(entry.section.department, 'semester') and entry.section.department.semester:
-                    semester_name = entry.section.department.semester.name
-
-            subject_course = ""
-            if entry.subject:
-                subject_course = entry.subject.name
-            elif entry.course:
-                subject_course = entry.course.name
-
-            writer.writerow([
-                entry.day,
-                entry.period,
-                entry.teacher.full_name if entry.teacher else 'Unknown',
-                entry.section.name if entry.section else 'Unknown',
-                entry.classroom.room_id if entry.classroom else 'Unknown',
-                subject_course,
-                semester_name,
-                department_name
-            ])
+        csv_text = cache.get(EXPORT_CACHE_KEY)
+        if csv_text is None:
+            csv_text = build_timetable_csv()
+            cache.set(EXPORT_CACHE_KEY, csv_text, timeout=EXPORT_CACHE_TIMEOUT)
 
         # Prepare response
-        output.seek(0)
-        response = make_response(output.getvalue())
+        response = make_response(csv_text)
         response.headers['Content-Type'] = 'text/csv'
         response.headers['Content-Disposition'] = 'attachment; filename=timetable.csv'
 
@@ -435,3 +395,55 @@ def export_timetable():
         print(f"Error exporting timetable: {e}")
         return jsonify({'error': 'Failed to export timetable'}), 500
 
+def build_timetable_csv():
+    """Render all timetable entries as CSV text."""
+
+    # Get all timetable entries
+    entries = TimetableEntry.query.options(
+        joinedload(TimetableEntry.teacher),
+        joinedload(TimetableEntry.section),
+        joinedload(TimetableEntry.classroom),
+        joinedload(TimetableEntry.subject),
+        joinedload(TimetableEntry.course)
+    ).all()
+
+    # Create CSV
+    output = io.StringIO()
+    writer = csv.writer(output)
+
+    # Write header
+    writer.writerow([
+        'Day', 'Period', 'Teacher', 'Section', 'Classroom', 
+        'Subject/Course', 'Semester', 'Department'
+    ])
+
+    # Write data
+    for entry in entries:
+        # Get semester and department info
+        semester_name = "Unknown"
+        department_name = "Unknown"
+
+        if hasattr(entry.section, 'department') and entry.section.department:
+            department_name = entry.section.department.name
+            if hasattr(entry.section.department, 'semester') and entry.section.department.semester:
+                semester_name = entry.section.department.semester.name
+
+        subject_course = ""
+        if entry.subject:
+            subject_course = entry.subject.name
+        elif entry.course:
+            subject_course = entry.course.name
+
+        writer.writerow([
+            entry.day,
+            entry.period,
+            entry.teacher.full_name if entry.teacher else 'Unknown',
+            entry.section.name if entry.section else 'Unknown',
+            entry.classroom.room_id if entry.classroom else 'Unknown',
+            subject_course,
+            semester_name,
+            department_name
+        ])
+
+    return output.getvalue()
+
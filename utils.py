@@ -1,10 +1,18 @@
+import atexit
 import hashlib
+import queue
 import random
+import re
 import string
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
 from datetime import datetime, timedelta, timezone
-from flask import request, jsonify
+from flask import request, jsonify, current_app
+from sqlalchemy import exc, func, inspect
 
-from extensions import db
+from extensions import db, cache
 from models import AppConfig, ActivityLog, SystemMetric
 
 
@@ -23,25 +31,185 @@ def set_config(key, value):
         config = AppConfig(key=key, value=str(value))
     db.session.add(config)
 
+ACTIVITY_LOG_BATCH_SIZE = 100
+ACTIVITY_LOG_KEEP = 20
+# Seconds the writer keeps collecting after the first queued entry, so a
+# burst of log calls lands in one insert and one commit.
+ACTIVITY_LOG_FLUSH_INTERVAL = 2
+
 def log_activity(level, message):
+    """Queue an activity log entry for the background writer, or write it directly when the app has none."""
+    entry = (level, message, datetime.now(timezone.utc))
+    log_queue = current_app.extensions.get('activity_log_queue')
+    if log_queue is None:
+        _save_activity_logs([entry])
+    else:
+        log_queue.put_nowait(entry)
+
+def start_activity_logger(app):
+    """Start the background thread that writes queued activity logs for this app."""
+    log_queue = queue.Queue()
+    app.extensions['activity_log_queue'] = log_queue
+    worker = threading.Thread(target=_write_activity_logs, args=(app, log_queue), name='activity-log-writer', daemon=True)
+    worker.start()
+    atexit.register(_stop_activity_logger, log_queue, worker)
+
+def _stop_activity_logger(log_queue, worker):
+    # Let the writer drain whatever is still queued before the process exits.
+    log_queue.put(None)
+    worker.join(timeout=5)
+
+def _write_activity_logs(app, log_queue):
+    stopping = False
+    while not stopping:
+        batch = [log_queue.get()]
+        deadline = time.monotonic() + ACTIVITY_LOG_FLUSH_INTERVAL
+        while len(batch) < ACTIVITY_LOG_BATCH_SIZE and batch[-1] is not None:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(log_queue.get(timeout=remaining) if remaining > 0 else log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if None in batch:
+            stopping = True
+            batch = [entry for entry in batch if entry is not None]
+        if not batch:
+            continue
+        with app.app_context():
+            _save_activity_logs(batch)
+
+def _save_activity_logs(entries):
     try:
-        log = ActivityLog(level=level, message=message)
-        db.session.add(log)
+        db.session.execute(ActivityLog.__table__.insert(), [
+            {"level": level, "message": message, "timestamp": timestamp} for level, message, timestamp in entries
+        ])
         # Keep only the last 20 logs
-        logs_to_delete = ActivityLog.query.order_by(ActivityLog.timestamp.desc()).offset(20).all()
-        for log_del in logs_to_delete:
-            db.session.delete(log_del)
+        stale_ids = [log_id for (log_id,) in db.session.query(ActivityLog.id).order_by(ActivityLog.timestamp.desc()).offset(ACTIVITY_LOG_KEEP)]
+        if stale_ids:
+            ActivityLog.query.filter(ActivityLog.id.in_(stale_ids)).delete(synchronize_session=False)
         db.session.commit()
     except Exception as e:
         print(f"Error logging activity: {e}")
         db.session.rollback()
 
-def calculate_growth(metric_key, current_value):
+def calculate_growths(current_values):
+    """Week-over-week growth for several metrics, reading the baselines in one query."""
     last_week = datetime.now(timezone.utc).date() - timedelta(days=7)
-    last_metric = SystemMetric.query.filter_by(key=metric_key).filter(SystemMetric.date <= last_week).order_by(SystemMetric.date.desc()).first()
-    if last_metric and last_metric.value > 0:
-        return round(((current_value - last_metric.value) / last_metric.value) * 100, 1)
-    return 0
+    latest = db.session.query(SystemMetric.key, func.max(SystemMetric.date).label('date')) \
+        .filter(SystemMetric.key.in_(current_values), SystemMetric.date <= last_week) \
+        .group_by(SystemMetric.key).subquery()
+    previous = dict(db.session.query(SystemMetric.key, SystemMetric.value)
+                    .join(latest, (SystemMetric.key == latest.c.key) & (SystemMetric.date == latest.c.date)))
+    growths = {}
+    for metric_key, current_value in current_values.items():
+        last_value = previous.get(metric_key)
+        growths[metric_key] = round(((current_value - last_value) / last_value) * 100, 1) if last_value and last_value > 0 else 0
+    return growths
+
+# Dashboard counters and growth, cached per app mode.
+DASHBOARD_CACHE_KEY = 'dashboard_stats:{}'
+DASHBOARD_CACHE_TIMEOUT = 60
+
+def invalidate_dashboard_cache():
+    """Drop the cached dashboard counters after a write that changes them."""
+    cache.delete_many(*(DASHBOARD_CACHE_KEY.format(mode) for mode in ('school', 'college')))
+
+# The timetable CSV export. Besides regenerating or clearing the timetable,
+# renaming any teacher, section, classroom, subject, course or structure item
+# it shows has to drop it.
+EXPORT_CACHE_KEY = 'timetable_export_csv'
+EXPORT_CACHE_TIMEOUT = 3600
+
+def invalidate_timetable_export():
+    """Drop the cached timetable CSV export."""
+    cache.delete(EXPORT_CACHE_KEY)
+
+USER_CONFLICTS = {"username": "Username already exists.", "email": "Email already exists."}
+
+# Where each driver names the violated constraint or columns in its error text:
+# SQLite "UNIQUE constraint failed: user.email", MySQL "... for key 'user.email'",
+# Postgres "Key (email)=(...) already exists".
+CONFLICT_NAME_PATTERNS = [
+    re.compile(r"UNIQUE constraint failed: ([\w., ]+)"),
+    re.compile(r"for key '([^']+)'"),
+    re.compile(r"Key \(([^)]+)\)="),
+]
+
+def conflict_names(error):
+    """Identifier parts of the constraint or columns a unique violation names, never the duplicate value."""
+    names = []
+    constraint = getattr(getattr(error.orig, 'diag', None), 'constraint_name', None)
+    if constraint:
+        names.append(constraint)
+    detail = str(error.orig)
+    for pattern in CONFLICT_NAME_PATTERNS:
+        names.extend(pattern.findall(detail))
+    return [part for name in names for part in re.split(r"[\s.,]+", name) if part]
+
+def unique_conflict_message(error, conflicts):
+    """Return the message for the column named by a unique-constraint violation, else None.
+
+    Messages are formatted with the request's JSON body, e.g. "Code '{code}' already exists.";
+    placeholders missing from the body are left empty.
+    """
+    detail = str(error.orig).lower()
+    if 'unique' not in detail and 'duplicate' not in detail and 'already exists' not in detail:
+        return None
+    names = conflict_names(error)
+    # Longer column names first, so e.g. "username" wins over a "user" entry.
+    for column in sorted(conflicts, key=len, reverse=True):
+        if any(f"_{column}_" in f"_{name}_" for name in names):
+            body = request.get_json(silent=True)
+            return conflicts[column].format_map(defaultdict(str, body if isinstance(body, dict) else {}))
+    return None
+
+def rollback_on_error(integrity_message=None, error_message=None, conflicts=None):
+    """Roll back the session and return a JSON error if the wrapped view raises.
+
+    Unique-constraint violations on a column listed in conflicts get a 409;
+    conflicts may also be a function returning that mapping for the current request;
+    other integrity errors get a 400 with integrity_message when one is given;
+    any other exception gets a 500 with error_message, or the exception text.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                return view(*args, **kwargs)
+            except exc.IntegrityError as e:
+                db.session.rollback()
+                conflict = unique_conflict_message(e, conflicts() if callable(conflicts) else conflicts) if conflicts else None
+                if conflict:
+                    return jsonify({"message": conflict}), 409
+                if integrity_message:
+                    return jsonify({"message": integrity_message}), 400
+                return jsonify({"message": error_message or f"An unexpected error occurred: {e}"}), 500
+            except Exception as e:
+                db.session.rollback()
+                return jsonify({"message": error_message or f"An unexpected error occurred: {e}"}), 500
+        return wrapper
+    return decorator
+
+def upgrade_schema():
+    """Bring an existing database up to the current models: create_all() only adds missing tables."""
+    upgrade_system_metric_index()
+    # Indexes declared on tables that already existed
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(db.engine, checkfirst=True)
+
+def upgrade_system_metric_index():
+    """Keep only the newest row of each duplicated (key, date) snapshot so the metric index can be unique."""
+    # Wrapped in a derived table so MySQL accepts a subquery on the table being deleted from
+    newest = db.session.query(func.max(SystemMetric.id).label('id')).group_by(SystemMetric.key, SystemMetric.date).subquery()
+    db.session.query(SystemMetric).filter(SystemMetric.id.not_in(db.session.query(newest.c.id))).delete(synchronize_session=False)
+    db.session.commit()
+    
+    # An older non-unique index is dropped here and rebuilt as unique by upgrade_schema
+    existing = {index['name']: index for index in inspect(db.engine).get_indexes('system_metric')}
+    if 'ix_system_metric_key_date' in existing and not existing['ix_system_metric_key_date']['unique']:
+        index = next(index for index in SystemMetric.__table__.indexes if index.name == 'ix_system_metric_key_date')
+        index.drop(db.engine)
 
 def validate_json_request():
     """Utility function to validate JSON requests and return data or error response"""